@@ -0,0 +1,394 @@
+"""
+archive.py
+
+This module is part of the Task Logger program. It keeps the live task log
+small by moving the rows of closed months into one partition per month,
+so reads of the live log (View Logs, the record cache, the header check)
+do not get slower as the months go by.
+
+Features:
+- Partitions kept as worksheets of the spreadsheet ("Foglio1 2024-05") or
+  as local SQLite files, one per month.
+- A manifest with the totals of every archived month (tasks, hours per
+  type and per collaborator), so month statistics of archived months need
+  no row at all.
+- Reading a single archived month touches only its own partition.
+- An archive epoch, increased by every run that moves rows, so processes
+  holding a copy of the live task log know to load it again.
+- Archiving again after an interrupted run moves every row once.
+"""
+from collections import Counter, defaultdict
+import json
+import os
+import time
+import gspread
+from records import parse_hours, valid_hours
+from storage import SheetStorage, SQLiteStorage, month_key
+
+MANIFEST_HEADERS = ["Month", "Tasks", "Hours", "Invalid", "Types",
+                    "Collaborators"]
+
+
+def month_label(key):
+    """
+    Turn a YYYYMM month key into a "YYYY-MM" label.
+
+    @return
+        str: The month label.
+    """
+    return f"{key // 100}-{key % 100:02d}"
+
+
+def cells(row):
+    """
+    @return
+        tuple: The six cells of a task row, as strings, padded with empty
+        cells.
+    """
+    values = tuple(str(value) for value in row[:6])
+    return values + ("",) * (6 - len(values))
+
+
+def summarize(rows):
+    """
+    Compute the manifest entry of the task rows of one month.
+
+    Args:
+        rows: The task rows, as lists of cell strings.
+
+    @return
+        dict: tasks, total, invalid (rows whose hours are not a positive
+        number),
+        and the hours per type and per collaborator.
+    """
+    entry = {"tasks": 0, "total": 0.0, "invalid": 0,
+             "types": defaultdict(float), "collaborators": defaultdict(float)}
+    for row in rows:
+        entry["tasks"] += 1
+        hours = parse_hours(row[3] if len(row) > 3 else "")
+        if not valid_hours(hours):
+            entry["invalid"] += 1
+            continue
+        entry["types"][row[4] if len(row) > 4 else ""] += hours
+        entry["collaborators"][row[0]] += hours
+        entry["total"] += hours
+    entry["types"] = dict(entry["types"])
+    entry["collaborators"] = dict(entry["collaborators"])
+    return entry
+
+
+def merge_entries(entry, other):
+    """
+    Add the totals of two manifest entries of the same month.
+
+    @return
+        dict: The combined entry.
+    """
+    merged = {key: entry[key] + other[key]
+              for key in ("tasks", "total", "invalid")}
+    for group in ("types", "collaborators"):
+        merged[group] = dict(entry[group])
+        for key, hours in other[group].items():
+            merged[group][key] = merged[group].get(key, 0.0) + hours
+    return merged
+
+
+class Partitions:
+    """
+    Interface of a set of monthly partitions and their manifest.
+
+    The manifest maps "YYYY-MM" labels to the entries built by summarize().
+    It is read once and then kept in memory, until epoch() finds that rows
+    were archived since.
+    """
+
+    def __init__(self):
+        self._manifest = None
+        self._epoch = None
+
+    def open(self, key, create=False):
+        """
+        Open the partition of a month.
+
+        Args:
+            key: The YYYYMM month key.
+            create: Whether to create the partition if it does not exist.
+
+        @return
+            Storage: The partition, or None if it does not exist.
+        """
+        raise NotImplementedError
+
+    def _read_manifest(self):
+        raise NotImplementedError
+
+    def _write_manifest(self, manifest):
+        raise NotImplementedError
+
+    def _read_epoch(self):
+        raise NotImplementedError
+
+    def _write_epoch(self, epoch):
+        raise NotImplementedError
+
+    def epoch(self):
+        """
+        Read the archive epoch, the number of archive runs that moved rows
+        out of the live task log.
+
+        It is read afresh every time, so runs made by other processes are
+        seen; when it has changed, the manifest is read again on next use.
+
+        @return
+            int: The archive epoch.
+        """
+        epoch = self._read_epoch()
+        if epoch != self._epoch:
+            self._manifest = None
+            self._epoch = epoch
+        return epoch
+
+    def manifest(self):
+        """
+        @return
+            dict: The manifest entries keyed by month label.
+        """
+        if self._manifest is None:
+            self._manifest = self._read_manifest()
+        return self._manifest
+
+    def update_manifest(self, entries):
+        """
+        Add the entries of newly archived rows to the manifest.
+
+        Args:
+            entries: Manifest entries keyed by month label.
+
+        @return
+            None
+        """
+        # Read afresh: another process may have archived since it was read
+        manifest = dict(self._read_manifest())
+        for label, entry in entries.items():
+            manifest[label] = (merge_entries(manifest[label], entry)
+                               if label in manifest else entry)
+        self._write_manifest(manifest)
+        self._manifest = manifest
+
+    def advance_epoch(self):
+        """
+        Increase the archive epoch after rows were moved out of the live
+        task log.
+
+        @return
+            None
+        """
+        epoch = self._read_epoch() + 1
+        self._write_epoch(epoch)
+        self._epoch = epoch
+
+
+class LocalPartitions(Partitions):
+    """
+    Monthly partitions kept as SQLite files ("2024-05.db") in a directory,
+    next to a manifest.json file and an epoch file.
+
+    Args:
+        directory: The archive directory, created when needed.
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+
+    def open(self, key, create=False):
+        path = os.path.join(self.directory, f"{month_label(key)}.db")
+        if not create and not os.path.exists(path):
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        return SQLiteStorage(path)
+
+    def _read_manifest(self):
+        path = os.path.join(self.directory, "manifest.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "manifest.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+    def _read_epoch(self):
+        try:
+            with open(os.path.join(self.directory, "epoch"),
+                      encoding="utf-8") as epoch_file:
+                return int(epoch_file.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_epoch(self, epoch):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "epoch")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as epoch_file:
+            epoch_file.write(str(epoch))
+        os.replace(f"{path}.tmp", path)
+
+
+class SheetPartitions(Partitions):
+    """
+    Monthly partitions kept as worksheets of the spreadsheet, titled after
+    the live worksheet and the month ("Foglio1 2024-05"), with the manifest
+    in the "Foglio1 manifest" worksheet and the archive epoch in cell
+    EPOCH_CELL of that worksheet, next to the manifest columns.
+
+    The record cache reads the epoch on every sync, and looking a worksheet
+    up fetches the metadata of the whole spreadsheet, so both the epoch and
+    a missing manifest worksheet are kept for CACHE_SECONDS before they are
+    read again. Rows archived by another process in the meantime are still
+    noticed by the tail check of the record cache (see RecordCache.sync).
+
+    Args:
+        spreadsheet: The gspread Spreadsheet holding the task log.
+        title: The title of the live worksheet.
+        wrap: Optional function applied to every worksheet opened, e.g. to
+            instrument it.
+    """
+
+    EPOCH_CELL = "H1"
+    CACHE_SECONDS = 30.0
+
+    def __init__(self, spreadsheet, title, wrap=None):
+        super().__init__()
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.wrap = wrap or (lambda worksheet: worksheet)
+        self._manifest_sheet = None
+        self._manifest_missed = None
+        self._epoch_read = None
+
+    def _worksheet(self, title, create):
+        try:
+            worksheet = self.spreadsheet.worksheet(title)
+        except gspread.exceptions.WorksheetNotFound:
+            if not create:
+                return None
+            worksheet = self.spreadsheet.add_worksheet(title, rows=100, cols=6)
+        return self.wrap(worksheet)
+
+    def open(self, key, create=False):
+        worksheet = self._worksheet(f"{self.title} {month_label(key)}", create)
+        return SheetStorage(worksheet) if worksheet else None
+
+    def _manifest_worksheet(self, create):
+        # Kept once found, and a miss for CACHE_SECONDS
+        if self._manifest_sheet is None and (
+                create or self._manifest_missed is None
+                or time.monotonic() - self._manifest_missed
+                >= self.CACHE_SECONDS):
+            self._manifest_sheet = self._worksheet(f"{self.title} manifest",
+                                                   create)
+            self._manifest_missed = (None if self._manifest_sheet
+                                     else time.monotonic())
+        return self._manifest_sheet
+
+    def epoch(self):
+        if (self._epoch_read is None
+                or time.monotonic() - self._epoch_read >= self.CACHE_SECONDS):
+            super().epoch()
+            self._epoch_read = time.monotonic()
+        return self._epoch
+
+    def _read_manifest(self):
+        worksheet = self._manifest_worksheet(False)
+        if worksheet is None:
+            return {}
+        return {
+            row[0]: {
+                "tasks": int(row[1]), "total": float(row[2]),
+                "invalid": int(row[3]), "types": json.loads(row[4]),
+                "collaborators": json.loads(row[5]),
+            }
+            for row in worksheet.get_all_values()[1:] if len(row) >= 6
+        }
+
+    def _write_manifest(self, manifest):
+        worksheet = self._manifest_worksheet(True)
+        rows = [MANIFEST_HEADERS] + [
+            [label, entry["tasks"], entry["total"], entry["invalid"],
+             json.dumps(entry["types"]), json.dumps(entry["collaborators"])]
+            for label, entry in sorted(manifest.items())
+        ]
+        worksheet.batch_clear(["A1:F"])
+        worksheet.update("A1", rows)
+
+    def _read_epoch(self):
+        worksheet = self._manifest_worksheet(False)
+        if worksheet is None:
+            return 0
+        value = worksheet.acell(self.EPOCH_CELL).value
+        return int(value) if value and value.isdigit() else 0
+
+    def _write_epoch(self, epoch):
+        self._manifest_worksheet(True).update(self.EPOCH_CELL, [[epoch]])
+
+
+def archive_months(storage, partitions, before):
+    """
+    Move the task rows of the months before ``before`` to their partitions.
+
+    Rows are first appended to their month partition, then the manifest is
+    updated, and only then are they deleted from the live task log, so an
+    interruption never loses a task. Rows already in their partition (left
+    in the live task log by an interrupted run) are not appended nor
+    counted in the manifest again, only deleted. Rows with a malformed date
+    stay in the live task log. The archive epoch is increased last, so
+    processes holding a copy of the live task log load it again.
+
+    Args:
+        storage: The live task log.
+        partitions: The Partitions to move the rows to.
+        before: The YYYYMM key of the first month to keep live.
+
+    @return
+        dict: The manifest entries of the rows moved, keyed by month label.
+    """
+    values = storage.read_all()
+    if len(values) < 2:
+        return {}
+    header = values[0]
+
+    months = defaultdict(list)
+    for index, row in enumerate(values[1:], start=2):
+        key = month_key(row[2]) if len(row) > 2 else None
+        if key and key < before:
+            months[key].append((index, row))
+
+    entries = {}
+    for key, items in sorted(months.items()):
+        partition = partitions.open(key, create=True)
+        archived = Counter(cells(row) for row in partition.read_all()[1:])
+        rows = []
+        for _, row in items:
+            if archived[cells(row)]:
+                archived[cells(row)] -= 1
+            else:
+                rows.append(row)
+        if not rows:
+            continue
+        if not partition.header():
+            partition.set_header(header)
+        partition.append_many(rows)
+        entries[month_label(key)] = summarize(rows)
+    if not months:
+        return {}
+
+    if entries:
+        partitions.update_manifest(entries)
+    storage.delete_rows([index for items in months.values()
+                         for index, _ in items])
+    partitions.advance_epoch()
+    return entries
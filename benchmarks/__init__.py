@@ -0,0 +1,6 @@
+"""
+Benchmarks for the Task Logger program.
+
+They run against synthetic task logs served by an in-memory stand-in for
+the gspread Worksheet, so they never touch the live spreadsheet.
+"""
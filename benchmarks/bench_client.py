@@ -0,0 +1,210 @@
+"""
+bench_client.py
+
+Measure what the shared Sheets client (client.py) saves, against a local
+HTTP/1.1 endpoint standing in for the Sheets API and the OAuth token
+endpoint. The endpoint counts the TCP connections it accepts and the access
+tokens it mints, and holds every new connection for HANDSHAKE seconds to
+stand for the TCP and TLS handshakes of the real API:
+- calls: CALLS authorized requests made one after the other, with a new
+  session per call, then with the pooled session.
+- parallel: the same requests made from WORKERS threads sharing a session
+  with the default connection pool, then with the pooled session.
+- tokens: STARTS process starts, each creating its credentials and making
+  one call, without and then with the token cache file.
+
+The service account key is generated on the fly and signed with python-rsa,
+so no real credentials are needed.
+
+Usage:
+- python3 -m benchmarks.bench_client [--calls 200] [--latency 0.005]
+  [--handshake 0.03]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from google.auth.transport.requests import AuthorizedSession
+from prettytable import PrettyTable
+import rsa
+from client import CachingCredentials, TokenCache, pooled_session
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+WORKERS = 16
+STARTS = 20
+
+
+class MockApi(ThreadingHTTPServer):
+    """
+    A keep-alive HTTP server answering every GET with a small JSON body
+    after ``latency`` seconds, and POST /token with a new access token.
+    Every new connection waits ``handshake`` seconds before its first
+    request is read.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency, handshake):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.latency = latency
+        self.handshake = handshake
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.tokens = 0
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.tokens = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in two writes: without this, delayed ACKs
+    # would add 40 ms to every call on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake)
+
+    def _reply(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self._reply({"range": "Foglio1!A1:F1",
+                     "values": [["Name", "Task", "Date", "Hours", "Type",
+                                 "Recorded At"]]})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.tokens += 1
+            token = f"token-{self.server.tokens}"
+        self._reply({"access_token": token, "expires_in": 3600,
+                     "token_type": "Bearer"})
+
+    def log_message(self, *args):
+        pass
+
+
+def service_account_info(token_uri):
+    """
+    @return
+        dict: A service account key for the mock token endpoint.
+    """
+    _, private_key = rsa.newkeys(1024)
+    return {
+        "type": "service_account",
+        "client_email": "bench@task-logger.iam.gserviceaccount.com",
+        "private_key": private_key.save_pkcs1().decode("ascii"),
+        "private_key_id": "bench",
+        "token_uri": token_uri,
+    }
+
+
+def credentials(info, token_cache=None):
+    creds = CachingCredentials.from_service_account_info(info, scopes=SCOPES)
+    creds.token_cache = token_cache
+    return creds
+
+
+def measure(server, work):
+    """
+    @return
+        tuple: (seconds, connections accepted, tokens minted) of ``work``.
+    """
+    server.reset()
+    started = time.perf_counter()
+    work()
+    return (time.perf_counter() - started, server.connections, server.tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="seconds the mock API takes per call")
+    parser.add_argument("--handshake", type=float, default=0.03,
+                        help="seconds a new connection takes to set up")
+    args = parser.parse_args()
+
+    server = MockApi(args.latency, args.handshake)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    info = service_account_info(f"{server.url}/token")
+    url = f"{server.url}/v4/spreadsheets/bench/values/Foglio1!A1:F1"
+    creds = credentials(info)
+    AuthorizedSession(creds).get(url)  # Mint the token outside the timings
+
+    table = PrettyTable(["Benchmark", "Variant", "Seconds", "Connections",
+                         "Tokens"])
+    table.align = "r"
+    table.align["Benchmark"] = table.align["Variant"] = "l"
+
+    def fresh_sessions():
+        for _ in range(args.calls):
+            with AuthorizedSession(creds) as session:
+                session.get(url)
+
+    def one_session(session):
+        def work():
+            for _ in range(args.calls):
+                session.get(url)
+        return work
+
+    def parallel(session):
+        def work():
+            with ThreadPoolExecutor(WORKERS) as pool:
+                list(pool.map(lambda _: session.get(url), range(args.calls)))
+        return work
+
+    rows = [
+        ("calls", "new session per call", fresh_sessions),
+        ("calls", "pooled session", one_session(pooled_session(creds))),
+        ("parallel", "default pool", parallel(AuthorizedSession(creds))),
+        ("parallel", "pooled session", parallel(pooled_session(creds))),
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = TokenCache(os.path.join(directory, "token_cache.json"))
+
+        def starts(token_cache):
+            def work():
+                for _ in range(STARTS):
+                    pooled_session(credentials(info, token_cache)).get(url)
+            return work
+
+        rows += [
+            ("tokens", "no token cache", starts(None)),
+            ("tokens", "token cache file", starts(cache)),
+        ]
+        for benchmark, variant, work in rows:
+            seconds, connections, tokens = measure(server, work)
+            table.add_row([benchmark, variant, f"{seconds:.3f}", connections,
+                           tokens])
+
+    server.shutdown()
+    print(f"{args.calls} calls, {STARTS} starts, "
+          f"{args.latency * 1000:.0f} ms API latency, "
+          f"{args.handshake * 1000:.0f} ms handshake, {WORKERS} workers")
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+bench_scheduler.py
+
+Measure the request scheduler (scheduler.py) under bursty load, with time
+scaled down so that one second stands for the one-minute quota window of
+the Sheets API.
+
+SESSIONS threads each run ROUNDS of what a busy session does: read the new
+rows of the task log, read the header row and log one task. They share one
+worksheet that answers after LATENCY seconds and rejects with 429 any call
+beyond QUOTA in the last second. Failed calls are retried with backoff, as
+the program does. The workload is run with the worksheet called directly,
+then through a Scheduler sized to the quota.
+
+Usage:
+- python3 -m benchmarks.bench_scheduler [--sessions 20] [--rounds 5]
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import threading
+import time
+import gspread
+from prettytable import PrettyTable
+from scheduler import BURST, Scheduled, Scheduler
+from task_queue import call_with_backoff
+from benchmarks.fake_sheet import FakeWorksheet
+from benchmarks.synthetic import generate_rows
+
+QUOTA = 60
+WINDOW = 1.0
+LATENCY = 0.02
+# Backoff of the retries, scaled down like the quota window
+BASE_DELAY = 0.05
+
+
+class QuotaResponse:
+    """
+    The response of a request rejected for quota, as gspread sees it.
+    """
+
+    status_code = 429
+    text = "Quota exceeded"
+
+    def json(self):
+        return {"error": {"code": 429, "message": self.text,
+                          "status": "RESOURCE_EXHAUSTED"}}
+
+
+class QuotaWorksheet(FakeWorksheet):
+    """
+    A FakeWorksheet that counts its calls and rejects those beyond QUOTA
+    per WINDOW seconds.
+    """
+
+    def __init__(self, rows):
+        super().__init__(rows, latency=LATENCY)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.rejected = 0
+
+    def _call(self):
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > WINDOW:
+                self.recent.popleft()
+            self.calls += 1
+            if len(self.recent) >= QUOTA:
+                self.rejected += 1
+                raise gspread.exceptions.APIError(QuotaResponse())
+            self.recent.append(now)
+        time.sleep(self.latency)
+
+
+def session(sheet, rounds, results):
+    """
+    Run the rounds of one session and record the latency of its writes.
+
+    @return
+        None
+    """
+    for number in range(rounds):
+        call_with_backoff(lambda: sheet.get("A2:F"), base_delay=BASE_DELAY)
+        call_with_backoff(lambda: sheet.row_values(1), base_delay=BASE_DELAY)
+        started = time.perf_counter()
+        call_with_backoff(
+            lambda: sheet.append_rows([["Bench", f"Task {number}",
+                                        "01-01-2024", "1", "Product", ""]]),
+            base_delay=BASE_DELAY)
+        results.append(time.perf_counter() - started)
+
+
+def measure(sessions, rounds, scheduled):
+    """
+    @return
+        dict: The wall-clock seconds, the calls that reached the worksheet,
+        the 429 answers, the failed sessions and the write latencies.
+    """
+    worksheet = QuotaWorksheet(generate_rows(200))
+    scheduler = Scheduler(per_minute=(QUOTA - BURST) * 60 / WINDOW)
+    sheet = Scheduled(worksheet, scheduler) if scheduled else worksheet
+    writes = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(sessions) as pool:
+        futures = [pool.submit(session, sheet, rounds, writes)
+                   for _ in range(sessions)]
+    failed = sum(1 for future in futures if future.exception())
+    writes.sort()
+    return {
+        "seconds": time.perf_counter() - started,
+        "calls": worksheet.calls,
+        "rejected": worksheet.rejected,
+        "failed": failed,
+        "coalesced": scheduler.stats["coalesced"],
+        "write_p95": writes[int(len(writes) * 0.95)] if writes else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    table = PrettyTable(["Worksheet", "Seconds", "API calls", "429s",
+                         "Failed sessions", "Coalesced reads",
+                         "Write p95 (ms)"])
+    table.align = "r"
+    for label, scheduled in (("direct", False), ("scheduled", True)):
+        result = measure(args.sessions, args.rounds, scheduled)
+        table.add_row([label, f"{result['seconds']:.2f}", result["calls"],
+                       result["rejected"], result["failed"],
+                       result["coalesced"],
+                       f"{result['write_p95'] * 1000:.0f}"])
+    print(f"{args.sessions} sessions x {args.rounds} rounds, quota {QUOTA} "
+          f"calls per {WINDOW:.0f}s, {LATENCY * 1000:.0f} ms per call")
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+bench_tables.py
+
+Measure the latency and peak memory of printing every task of a synthetic
+task log as a table:
+- prettytable: one PrettyTable holding every row, printed at once (how
+  tables were rendered before tables.py).
+- measured: tables.render_table on the rows, widths measured in one pass.
+- streamed: tables.render_records straight from the record cache, widths
+  taken from the cache columns (what "run.py logs --format table" does).
+
+The output goes to a sink that only counts characters, so the terminal
+does not weigh on the results.
+
+Usage:
+- python3 -m benchmarks.bench_tables [--rows 100000 200000]
+"""
+import argparse
+from prettytable import PrettyTable
+from records import RecordCache
+from storage import SheetStorage
+from tables import cache_rows, render_records, render_table
+from benchmarks.fake_sheet import FakeWorksheet
+from benchmarks.run_benchmarks import measure
+from benchmarks.synthetic import generate_rows
+
+DEFAULT_SIZES = [100_000, 200_000]
+
+
+class Sink:
+    """
+    A text output that counts what is written to it and keeps nothing.
+    """
+
+    def __init__(self):
+        self.characters = 0
+
+    def write(self, text):
+        self.characters += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def bench_size(rows):
+    """
+    Benchmark the three renderers on a task log of ``rows`` tasks.
+
+    @return
+        dict: (seconds, peak bytes) for each renderer.
+    """
+    cache = RecordCache(SheetStorage(FakeWorksheet(generate_rows(rows))))
+    cache.load()
+    keys = cache.record_keys()
+    positions = range(len(cache))
+
+    def prettytable():
+        table = PrettyTable()
+        table.field_names = keys
+        table.add_rows(cache_rows(cache, positions))
+        print(table, file=Sink())
+
+    results = {"prettytable": measure(prettytable)}
+    results["measured"] = measure(lambda: render_table(
+        keys, list(cache_rows(cache, positions)), Sink()))
+    results["streamed"] = measure(lambda: render_records(
+        cache, positions, Sink()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_SIZES)
+    args = parser.parse_args()
+
+    table = PrettyTable()
+    table.field_names = ["Rows", "Renderer", "Latency (ms)",
+                         "Peak memory (MB)"]
+    table.align = "r"
+    for rows in args.rows:
+        for renderer, (seconds, peak) in bench_size(rows).items():
+            table.add_row([rows, renderer, f"{seconds * 1000:.0f}",
+                           f"{peak / 2 ** 20:.2f}"])
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+fake_sheet.py
+
+In-memory stand-in for the gspread ``Worksheet`` used by the benchmarks.
+
+It implements the worksheet calls made by the Task Logger program with the
+same row numbering and return shapes as gspread (values as strings, A1
+ranges, append responses carrying the updated range), and can optionally
+sleep to simulate the latency of the Sheets API. Its ``spreadsheet``
+answers the Drive request for the file version, which every write
+increases.
+"""
+from types import SimpleNamespace
+import re
+import time
+
+RANGE_PATTERN = re.compile(r"^[A-Z]+(\d+)(?::[A-Z]+(\d*))?$")
+
+
+class FakeSpreadsheet:
+    """
+    The spreadsheet of a FakeWorksheet, also standing in for the client
+    that reads its Drive metadata (see SheetStorage.revision).
+    """
+
+    id = "fake-spreadsheet"
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.client = self
+
+    def request(self, method, url, params=None, **_):
+        self.worksheet._call()
+        version = str(self.worksheet.version)
+        return SimpleNamespace(json=lambda: {"version": version})
+
+
+class FakeWorksheet:
+    """
+    A worksheet whose cells live in a list of rows.
+
+    Args:
+        rows: The initial rows, header included.
+        title: The worksheet title used in A1 ranges.
+        latency: Seconds to sleep on every call, to simulate the API.
+    """
+
+    def __init__(self, rows=None, title="Foglio1", latency=0.0):
+        self.rows = [[str(value) for value in row] for row in rows or []]
+        self.title = title
+        self.latency = latency
+        self.calls = 0
+        self.version = 1
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _parse_range(self, range_name):
+        match = RANGE_PATTERN.match(range_name.split("!")[-1])
+        if not match:
+            raise ValueError(f"Unsupported range: {range_name}")
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else len(self.rows)
+        return start, end
+
+    def get_all_values(self, **_):
+        self._call()
+        width = max((len(row) for row in self.rows), default=0)
+        return [row + [""] * (width - len(row)) for row in self.rows]
+
+    def get(self, range_name, **_):
+        self._call()
+        start, end = self._parse_range(range_name)
+        rows = [list(row) for row in self.rows[start - 1:end]]
+        while rows and not any(rows[-1]):
+            rows.pop()  # The API trims trailing empty rows
+        return rows
+
+    def row_values(self, row, **_):
+        self._call()
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def append_rows(self, values, **_):
+        self._call()
+        self.version += 1
+        start = len(self.rows) + 1
+        self.rows.extend([str(value) for value in row] for row in values)
+        return {
+            "updates": {
+                "updatedRange": f"{self.title}!A{start}:F{len(self.rows)}"
+            }
+        }
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def update(self, range_name, values=None, **_):
+        self._call()
+        self.version += 1
+        start, _ = self._parse_range(range_name)
+        for offset, row in enumerate(values or []):
+            index = start - 1 + offset
+            while len(self.rows) <= index:
+                self.rows.append([])
+            self.rows[index] = [str(value) for value in row]
+
+    def delete_rows(self, start_index, end_index=None):
+        self._call()
+        self.version += 1
+        del self.rows[start_index - 1:end_index or start_index]
+
+    def batch_clear(self, ranges):
+        self._call()
+        self.version += 1
+        for range_name in ranges:
+            start, end = self._parse_range(range_name)
+            for index in range(start - 1, min(end, len(self.rows))):
+                self.rows[index] = []
+        while self.rows and not any(self.rows[-1]):
+            self.rows.pop()
@@ -0,0 +1,173 @@
+"""
+run_benchmarks.py
+
+Measure the latency and peak memory of the main Task Logger code paths on
+synthetic task logs served by the in-memory FakeWorksheet:
+- load: download the task log into the record cache.
+- sync: bring an up-to-date cache in line with the sheet.
+- filter: select_month and the month lookup of the record cache, for the
+  current month.
+- aggregate: display_statistics_table for the current month.
+- render: view_logs, first page.
+- query: a two-year custom statistics query grouped by Name and Type.
+- fan-out: load the same number of rows split across TEAMS worksheets that
+  each answer after API_LATENCY seconds, read in parallel.
+
+Usage:
+- python3 -m benchmarks.run_benchmarks [--rows 1000 100000 1000000]
+  [--json results.json]
+"""
+from contextlib import redirect_stdout
+from unittest import mock
+import argparse
+import gc
+import io
+import json
+import time
+import tracemalloc
+from prettytable import PrettyTable
+import run
+from records import RecordCache
+from query import DateIndex, run_query
+from storage import MultiStorage, SheetStorage
+from benchmarks.fake_sheet import FakeWorksheet
+from benchmarks.synthetic import generate_rows
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+# Worksheets and simulated API latency of the fan-out benchmark
+TEAMS = 10
+API_LATENCY = 0.05
+
+
+def measure(func):
+    """
+    Run ``func`` twice: once for wall-clock time, once under tracemalloc.
+
+    Args:
+        func: The callable to measure.
+
+    @return
+        tuple: (seconds, peak_bytes).
+    """
+    gc.collect()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def scripted(func, *answers):
+    """
+    Wrap an interactive function so it runs with canned input and no output.
+
+    Args:
+        func: The interactive function.
+        *answers: The replies given to its input() prompts, in order.
+
+    @return
+        callable: A function running ``func`` non-interactively.
+    """
+    def wrapper():
+        replies = iter(answers)
+        with mock.patch("builtins.input", lambda *_: next(replies)), \
+                redirect_stdout(io.StringIO()):
+            func()
+    return wrapper
+
+
+def use_cache(cache):
+    """
+    Point the globals of run.py at a storage and cache, as init() would.
+
+    @return
+        None
+    """
+    run.STORAGE = cache.storage
+    run.CACHE = cache
+    run.DATE_INDEX = DateIndex(cache)
+    run.CONNECTED.set()
+    run.SETUP_DONE = True
+
+
+def bench_size(rows):
+    """
+    Benchmark every code path on a synthetic sheet of ``rows`` tasks.
+
+    Args:
+        rows: The number of task rows.
+
+    @return
+        dict: Seconds and peak bytes for each code path.
+    """
+    sheet = FakeWorksheet(generate_rows(rows))
+    storage = SheetStorage(sheet)
+    results = {}
+
+    def load():
+        use_cache(RecordCache(storage))
+        run.CACHE.load()
+
+    results["load"] = measure(load)
+    results["sync"] = measure(run.CACHE.sync)
+    # The current month is the last entry of the month menu
+    def filter_month():
+        _, month, year = run.select_month()
+        run.CACHE.records_for_month(year, month)
+
+    results["filter"] = measure(scripted(filter_month, "12"))
+    results["aggregate"] = measure(
+        scripted(run.display_statistics_table, "12"))
+    results["render"] = measure(scripted(run.view_logs, "q"))
+    results["query"] = measure(lambda: run_query(
+        run.CACHE, run.DATE_INDEX, None, None, ("Name", "Type")))
+
+    team_sheets = [
+        FakeWorksheet(generate_rows(rows // TEAMS, seed=team),
+                      latency=API_LATENCY)
+        for team in range(TEAMS)
+    ]
+    results["fan-out"] = measure(lambda: RecordCache(MultiStorage(
+        [SheetStorage(sheet) for sheet in team_sheets])).load())
+    return results
+
+
+def main():
+    """
+    Run the benchmarks and print (and optionally save) the results.
+
+    @return
+        None
+    """
+    parser = argparse.ArgumentParser(description="Task Logger benchmarks")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    table = PrettyTable()
+    table.field_names = ["Rows", "Path", "Latency (ms)", "Peak memory (MB)"]
+    table.align = "r"
+    report = {}
+    for rows in args.rows:
+        results = bench_size(rows)
+        report[rows] = {
+            path: {"seconds": seconds, "peak_bytes": peak}
+            for path, (seconds, peak) in results.items()
+        }
+        for path, (seconds, peak) in results.items():
+            table.add_row([rows, path, f"{seconds * 1000:.2f}",
+                           f"{peak / 2 ** 20:.2f}"])
+    print(table)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
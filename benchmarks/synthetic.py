@@ -0,0 +1,50 @@
+"""
+synthetic.py
+
+Generator of synthetic task logs for the benchmarks.
+"""
+from datetime import datetime, timedelta
+import random
+
+HEADERS = ["Name", "Task", "Date", "Hours", "Type", "Recorded At"]
+TASK_TYPES = ["Administrative", "Marketing", "Product"]
+
+
+def generate_rows(count, collaborators=25, task_types=None, days=730,
+                  end=None, seed=42):
+    """
+    Generate synthetic task rows, header first, in the sheet's format.
+
+    Args:
+        count: The number of task rows.
+        collaborators: The number of distinct collaborator names.
+        task_types: The task types to pick from (defaults to the three
+            types of the program).
+        days: How many days back from ``end`` the dates are spread over.
+        end: The most recent task date, defaults to today.
+        seed: Seed of the random generator, for repeatable runs.
+
+    @return
+        list: The header row followed by ``count`` task rows of strings.
+    """
+    rng = random.Random(seed)
+    task_types = task_types or TASK_TYPES
+    end = end or datetime.now()
+    names = [f"Collaborator {index:03d}" for index in range(collaborators)]
+    dates = [
+        (end - timedelta(days=offset)).strftime("%d-%m-%Y")
+        for offset in range(days)
+    ]
+    recorded_at = end.strftime("%d-%m-%Y %H:%M:%S")
+
+    rows = [list(HEADERS)]
+    for index in range(count):
+        rows.append([
+            rng.choice(names),
+            f"Task {index}",
+            rng.choice(dates),
+            str(rng.choice((0.5, 1, 1.5, 2, 3, 4, 6, 8))),
+            rng.choice(task_types),
+            recorded_at,
+        ])
+    return rows
@@ -0,0 +1,184 @@
+"""
+client.py
+
+This module is part of the Task Logger program. It builds the Google Sheets
+client once per process and makes every Sheets call reuse connections and
+access tokens.
+
+Features:
+- One authorized HTTP session per set of credentials, shared by every
+  caller in the process (menu, background connection, replication,
+  parallel reads, worker sessions), with a keep-alive connection pool
+  sized for concurrent calls, so calls skip TCP and TLS handshakes.
+- Access tokens cached until shortly before they expire, in memory and in
+  a token cache file readable only by its owner, so a new process reuses
+  the token of the previous one instead of minting a new one.
+"""
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import threading
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+import gspread
+
+# Local file caching the access token between processes
+TOKEN_CACHE_FILE = ".token_cache.json"
+# Connections kept open per host: enough for parallel reads and sessions
+POOL_SIZE = 16
+# Cached tokens this close to their expiry are minted again
+EXPIRY_MARGIN = timedelta(minutes=5)
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def utcnow():
+    """
+    @return
+        datetime: The current UTC time, naive like google-auth expiries.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TokenCache:
+    """
+    Access tokens stored in a JSON file, keyed by account and scopes.
+
+    The file is created with mode 0600 and replaced atomically on every
+    write.
+
+    Args:
+        path: The token cache file path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, key):
+        """
+        Return a cached token that is still valid for a while.
+
+        Args:
+            key: The account and scopes the token was minted for.
+
+        @return
+            tuple: (token, expiry), or None if there is no usable token.
+        """
+        entry = self._read().get(key)
+        if not entry:
+            return None
+        try:
+            expiry = datetime.fromisoformat(entry["expiry"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if expiry - utcnow() <= EXPIRY_MARGIN:
+            return None
+        return entry["token"], expiry
+
+    def save(self, key, token, expiry):
+        """
+        Store a token; failures are ignored, the cache is an optimization.
+
+        @return
+            None
+        """
+        entries = self._read()
+        entries[key] = {"token": token, "expiry": expiry.isoformat()}
+        temporary = f"{self.path}.tmp"
+        try:
+            descriptor = os.open(temporary,
+                                 os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, "w", encoding="utf-8") as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(temporary, self.path)
+        except OSError:
+            pass
+
+
+class CachingCredentials(service_account.Credentials):
+    """
+    Service account credentials that look for a cached access token before
+    minting a new one, and cache every token they mint.
+
+    Refreshes are serialized, so concurrent calls sharing the credentials
+    mint at most one token. A token the API has just rejected is never
+    taken from the cache again.
+    """
+
+    token_cache = None
+    _refresh_lock = threading.Lock()
+
+    def _cache_key(self):
+        scopes = " ".join(sorted(self.scopes or []))
+        return f"{self.service_account_email} {scopes}"
+
+    def refresh(self, request):
+        stale = self.token
+        with self._refresh_lock:
+            if self.token != stale and self.valid:
+                return  # Refreshed by another thread meanwhile
+            cached = self.token_cache.load(self._cache_key()) \
+                if self.token_cache else None
+            if cached and cached[0] != stale:
+                self.token, self.expiry = cached
+                return
+            super().refresh(request)
+            if self.token_cache:
+                self.token_cache.save(self._cache_key(), self.token,
+                                      self.expiry)
+
+
+def pooled_session(credentials, pool_size=POOL_SIZE):
+    """
+    Create an authorized session with a larger keep-alive connection pool.
+
+    Args:
+        credentials: The google-auth credentials.
+        pool_size: The connections kept open per host.
+
+    @return
+        AuthorizedSession: The session.
+    """
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_client(creds_info, scopes, token_cache_path=TOKEN_CACHE_FILE):
+    """
+    Return the shared gspread client for a service account.
+
+    The client, its session and its credentials are created on the first
+    call and reused by every later call in the process.
+
+    Args:
+        creds_info: The service account info (the decoded JSON key).
+        scopes: The OAuth scopes to request.
+        token_cache_path: The token cache file, or None to cache tokens in
+            memory only.
+
+    @return
+        tuple: (client, credentials).
+    """
+    key = (creds_info.get("client_email"), tuple(scopes))
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            credentials = CachingCredentials.from_service_account_info(
+                creds_info, scopes=scopes)
+            if token_cache_path:
+                credentials.token_cache = TokenCache(token_cache_path)
+            client = gspread.Client(auth=credentials,
+                                    session=pooled_session(credentials))
+            _CLIENTS[key] = (client, credentials)
+        return _CLIENTS[key]
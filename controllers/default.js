@@ -1,13 +1,63 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const net = require('net');
+const childProcess = require('child_process');
+
+// When set, sessions are served by one long-lived Python worker (server.py)
+const WORKER_PORT = process.env.WORKER_PORT;
 
 exports.install = function () {
 
     ROUTE('/');
     WEBSOCKET('/', socket, ['raw']);
 
+    if (WORKER_PORT) {
+        startWorker();
+    }
+
 };
 
+function startWorker() {
+
+    const worker = childProcess.spawn('python3', ['server.py', '--port', WORKER_PORT], {
+        cwd: process.env.PWD,
+        env: process.env,
+        stdio: 'inherit'
+    });
+
+    worker.on('exit', function (code, signal) {
+        console.log("Worker exited, restarting");
+        setTimeout(startWorker, 1000);
+    });
+}
+
+function connectWorker(client) {
+
+    const conn = net.connect(parseInt(WORKER_PORT), '127.0.0.1');
+    conn.setEncoding('utf8');
+
+    conn.on('data', function (data) {
+        client.send(data);
+    });
+
+    conn.on('close', function () {
+        client.tty = null;
+        client.close();
+        console.log("Session closed");
+    });
+
+    conn.on('error', function (err) {
+        console.log('Worker connection error: ', err.message);
+    });
+
+    // Same interface as the pty for the message and close handlers
+    conn.kill = function () {
+        conn.destroy();
+    };
+
+    return conn;
+}
+
 function socket() {
 
     this.encodedecode = false;
@@ -15,6 +65,11 @@ function socket() {
 
     this.on('open', function (client) {
 
+        if (WORKER_PORT) {
+            client.tty = connectWorker(client);
+            return;
+        }
+
         // Spawn terminal
         client.tty = Pty.spawn('python3', ['run.py'], {
             name: 'xterm-color',
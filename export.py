@@ -0,0 +1,335 @@
+"""
+export.py
+
+This module is part of the Task Logger program. It streams the task log to
+a file in chunks, so exports of millions of rows run in bounded memory:
+neither the whole table nor a rendered copy of it is ever held at once.
+
+Features:
+- Read the task log chunk by chunk, from the storage or from the cache.
+- Write CSV, JSON Lines, a JSON array or a compact columnar file.
+- Collect the month statistics (hours per type, per collaborator and in
+  total) while streaming, to be written alongside the export.
+
+Columnar file layout (all integers little-endian):
+- MAGIC, then a block with the column names.
+- One block per row group (chunk of rows). A block is a 4-byte length, a
+  JSON description of its columns, then the column data it describes:
+  Name and Type dictionary-encoded as uint32 codes, Date packed as uint32
+  YYYYMMDD, Hours as float64, Task and Recorded At as UTF-8 text with
+  uint32 end offsets. Hours are stored as numbers, so "2.0" reads back as
+  "2"; cells that do not parse as a date or a number are kept as text in
+  the description.
+- A 4-byte zero length ends the file.
+"""
+from array import array
+from collections import defaultdict
+import csv
+import json
+import math
+import struct
+import sys
+from archive import merge_entries, month_label, summarize
+from records import format_date, pack_date, parse_hours
+from storage import month_key
+
+EXPORT_FORMATS = ("csv", "jsonl", "json", "columnar")
+CHUNK_ROWS = 5_000
+COLUMNAR_MAGIC = b"TLCOL01\n"
+COLUMNAR_VERSION = 1
+
+
+def storage_chunks(storage, chunk_rows=CHUNK_ROWS):
+    """
+    Read the task rows of a storage one range at a time.
+
+    The Sheets API trims trailing empty rows from a range, so a short read
+    does not mean the end of the task log: a cleared row at the bottom of
+    a range only shortens that range. Reading goes on until a range comes
+    back empty; the rest of the log is then read in one open-ended range,
+    which is empty only past the last row.
+
+    Args:
+        storage: The storage to read.
+        chunk_rows: The number of rows per read.
+
+    @return
+        generator: Lists of at most ``chunk_rows`` task rows.
+    """
+    start = 2
+    while True:
+        rows = storage.read_range(start, start + chunk_rows - 1)
+        if not rows:
+            rows = storage.read_range(start)
+            for offset in range(0, len(rows), chunk_rows):
+                yield rows[offset:offset + chunk_rows]
+            return
+        yield rows
+        start += chunk_rows
+
+
+def cache_chunks(cache, chunk_rows=CHUNK_ROWS):
+    """
+    Rebuild the task rows of a loaded cache one chunk at a time.
+
+    @return
+        generator: Lists of at most ``chunk_rows`` task rows.
+    """
+    for start in range(0, len(cache), chunk_rows):
+        yield [
+            ["" if value is None else str(value)
+             for value in cache.record(position).values()]
+            for position in range(start, min(start + chunk_rows, len(cache)))
+        ]
+
+
+def pad(row):
+    """
+    @return
+        list: The first six cells of a row, padded with empty cells.
+    """
+    row = list(row[:6])
+    return row + [""] * (6 - len(row))
+
+
+class CsvExport:
+    """
+    Streams rows as CSV with a header row.
+    """
+
+    binary = False
+
+    def __init__(self, output, headers):
+        self.writer = csv.writer(output)
+        self.writer.writerow(headers)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class JsonLinesExport:
+    """
+    Streams rows as one JSON object per line.
+    """
+
+    binary = False
+
+    def __init__(self, output, headers):
+        self.output = output
+        self.headers = headers
+
+    def write(self, rows):
+        self.output.write("".join(
+            json.dumps(dict(zip(self.headers, row))) + "\n" for row in rows))
+
+    def close(self):
+        pass
+
+
+class JsonExport(JsonLinesExport):
+    """
+    Streams rows as a JSON array of objects, written piece by piece.
+    """
+
+    def __init__(self, output, headers):
+        super().__init__(output, headers)
+        self.output.write("[")
+        self.first = True
+
+    def write(self, rows):
+        for row in rows:
+            self.output.write("\n  " if self.first else ",\n  ")
+            self.output.write(json.dumps(dict(zip(self.headers, row))))
+            self.first = False
+
+    def close(self):
+        self.output.write("\n]\n" if not self.first else "]\n")
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+class ColumnarExport:
+    """
+    Streams rows to the columnar file format, one row group per chunk.
+    """
+
+    binary = True
+
+    def __init__(self, output, headers):
+        self.output = output
+        self.output.write(COLUMNAR_MAGIC)
+        self._block(json.dumps({"version": COLUMNAR_VERSION,
+                                "columns": headers}).encode("utf-8"))
+
+    def _block(self, data):
+        self.output.write(struct.pack("<I", len(data)))
+        self.output.write(data)
+
+    def write(self, rows):
+        if not rows:
+            return
+        rows = [pad(row) for row in rows]
+        names, tasks, dates, hours, types, recorded = zip(*rows)
+        columns = []
+        blobs = []
+
+        for values in (names, types):
+            table = {}
+            codes = array("I", (table.setdefault(value, len(table))
+                                for value in values))
+            columns.append({"encoding": "dictionary", "values": list(table)})
+            blobs.append(_little_endian(codes))
+
+        packed = array("I", map(pack_date, dates))
+        columns.append({"encoding": "date", "raw": {
+            index: value for index, value in enumerate(dates)
+            if not packed[index]}})
+        blobs.append(_little_endian(packed))
+
+        numbers = array("d", map(parse_hours, hours))
+        columns.append({"encoding": "float64", "raw": {
+            index: value for index, value in enumerate(hours)
+            if math.isnan(numbers[index])}})
+        blobs.append(_little_endian(numbers))
+
+        for values in (tasks, recorded):
+            encoded = [value.encode("utf-8") for value in values]
+            ends = array("I")
+            end = 0
+            for data in encoded:
+                end += len(data)
+                ends.append(end)
+            columns.append({"encoding": "text"})
+            blobs.append(_little_endian(ends) + b"".join(encoded))
+
+        description = {
+            "rows": len(rows),
+            "columns": columns,
+            "lengths": [len(blob) for blob in blobs],
+        }
+        self._block(json.dumps(description).encode("utf-8"))
+        for blob in blobs:
+            self.output.write(blob)
+
+    def close(self):
+        self.output.write(struct.pack("<I", 0))
+
+
+EXPORTERS = {
+    "csv": CsvExport,
+    "jsonl": JsonLinesExport,
+    "json": JsonExport,
+    "columnar": ColumnarExport,
+}
+
+
+def _unpack(code, data):
+    values = array(code)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def read_columnar(input_file):
+    """
+    Read back a columnar export, one row group at a time.
+
+    Args:
+        input_file: The export opened in binary mode.
+
+    @return
+        generator: Lists of task rows (Name, Task, Date, Hours, Type,
+        Recorded At) as strings.
+
+    Raises:
+        ValueError: If the file is not a columnar export.
+    """
+    def read_block():
+        (length,) = struct.unpack("<I", input_file.read(4))
+        return input_file.read(length)
+
+    if input_file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a Task Logger columnar export.")
+    read_block()  # Column names
+
+    while True:
+        block = read_block()
+        if not block:
+            return
+        description = json.loads(block)
+        blobs = [input_file.read(length) for length in description["lengths"]]
+        count = description["rows"]
+        name_column, type_column, date_column, hours_column = \
+            description["columns"][:4]
+
+        names = [name_column["values"][c] for c in _unpack("I", blobs[0])]
+        types = [type_column["values"][c] for c in _unpack("I", blobs[1])]
+        dates = [format_date(packed) if packed
+                 else date_column["raw"].get(str(index), "")
+                 for index, packed in enumerate(_unpack("I", blobs[2]))]
+        hours = []
+        for index, value in enumerate(_unpack("d", blobs[3])):
+            if math.isnan(value):
+                hours.append(hours_column["raw"].get(str(index), ""))
+            else:
+                hours.append(str(int(value)) if value.is_integer()
+                             else str(value))
+        texts = []
+        for blob in blobs[4:6]:
+            ends = _unpack("I", blob[:4 * count])
+            data = blob[4 * count:]
+            starts = [0] + list(ends[:-1])
+            texts.append([data[start:end].decode("utf-8")
+                          for start, end in zip(starts, ends)])
+        yield [list(row) for row in
+               zip(names, texts[0], dates, hours, types, texts[1])]
+
+
+def export_rows(chunks, headers, output_format, output):
+    """
+    Stream chunks of task rows to a file and collect their statistics.
+
+    Args:
+        chunks: An iterable of lists of task rows.
+        headers: The column names.
+        output_format: One of EXPORT_FORMATS.
+        output: The file object to write to; binary for "columnar".
+
+    @return
+        tuple: (rows written, statistics) where statistics maps "YYYY-MM"
+        labels to the month totals (see archive.summarize) and holds the
+        overall "tasks" and "total".
+    """
+    exporter = EXPORTERS[output_format](output, headers)
+    months = {}
+    count = 0
+    for rows in chunks:
+        rows = [pad(row) for row in rows]
+        exporter.write(rows)
+        count += len(rows)
+        by_month = defaultdict(list)
+        for row in rows:
+            key = month_key(row[2])
+            if key:
+                by_month[key].append(row)
+        for key, month_rows in by_month.items():
+            label = month_label(key)
+            entry = summarize(month_rows)
+            months[label] = (merge_entries(months[label], entry)
+                             if label in months else entry)
+    exporter.close()
+
+    statistics = {
+        "months": dict(sorted(months.items())),
+        "tasks": count,
+        "total": sum(entry["total"] for entry in months.values()),
+    }
+    return count, statistics
@@ -0,0 +1,213 @@
+"""
+importer.py
+
+This module is part of the Task Logger program. It imports historical tasks
+from CSV or Excel files instead of typing them one by one.
+
+The file is streamed twice and never held in memory: a first pass validates
+every row and collects every error, so all invalid rows are reported at
+once, and a second pass uploads the valid rows in chunks sized to stay
+within the payload the Sheets API accepts in one request.
+
+Features:
+- CSV files, and .xlsx files when openpyxl is installed.
+- An optional header row, detected by its first cell ("Name").
+- Columns Name, Task, Date, Hours, Type and optionally Recorded At.
+- Chunked uploads retried with backoff on quota and server errors.
+- Interrupted imports resumed by skipping the rows already uploaded.
+"""
+import csv
+from datetime import date, datetime
+from itertools import islice
+import json
+from task_queue import call_with_backoff
+
+try:
+    import openpyxl
+except ImportError:  # Only needed for .xlsx files
+    openpyxl = None
+
+# The Sheets API advises keeping request payloads under 2 MB
+CHUNK_BYTES = 2_000_000
+CHUNK_ROWS = 10_000
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm")
+
+
+def cell_text(value):
+    """
+    Convert a spreadsheet cell value to the text the prompts would take.
+
+    @return
+        str: Dates as DD-MM-YYYY, whole numbers without decimals, empty
+        cells as an empty string.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%d-%m-%Y")
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def read_rows(path):
+    """
+    Stream the rows of a CSV or Excel file.
+
+    Args:
+        path: The file path; .xlsx and .xlsm files are read with openpyxl,
+            anything else as UTF-8 CSV.
+
+    @return
+        generator: (line number, list of cell strings) pairs. A header row
+        is skipped, as are empty lines.
+
+    Raises:
+        ValueError: If an Excel file is given and openpyxl is missing.
+    """
+    if path.lower().endswith(EXCEL_EXTENSIONS):
+        if openpyxl is None:
+            raise ValueError("Reading Excel files needs openpyxl "
+                             "(pip install openpyxl).")
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            yield from _data_rows(
+                (number, [cell_text(value) for value in row])
+                for number, row in enumerate(rows, start=1))
+        finally:
+            workbook.close()
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as import_file:
+            reader = csv.reader(import_file)
+            yield from _data_rows((reader.line_num, row) for row in reader)
+
+
+def _data_rows(rows):
+    for number, row in rows:
+        while row and not row[-1].strip():
+            row = row[:-1]
+        if not row:
+            continue
+        if number == 1 and row[0].strip().lower() == "name":
+            continue
+        yield number, row
+
+
+def check_rows(rows, validate):
+    """
+    Validate rows and collect every error.
+
+    Args:
+        rows: (line number, cells) pairs from read_rows.
+        validate: The function validating the first five cells of a task,
+            raising ValueError (run.validate_task).
+
+    @return
+        tuple: (valid, errors) where valid is the number of valid rows and
+        errors is a list of (line number, message).
+    """
+    valid = 0
+    errors = []
+    for number, row in rows:
+        try:
+            validate_row(row, validate)
+            valid += 1
+        except ValueError as e:
+            errors.append((number, str(e)))
+    return valid, errors
+
+
+def validate_row(row, validate):
+    """
+    Validate one imported row.
+
+    Args:
+        row: The cells: Name, Task, Date, Hours, Type and optionally
+            Recorded At.
+        validate: The task validation function.
+
+    @return
+        list: The validated task fields, plus Recorded At if given.
+
+    Raises:
+        ValueError: If the row has the wrong number of cells or a field is
+        invalid.
+    """
+    if len(row) not in (5, 6):
+        raise ValueError(f"expected 5 or 6 fields, got {len(row)}.")
+    task = validate(*row[:5])
+    if len(row) == 6:
+        task.append(row[5].strip())
+    return task
+
+
+def chunks(rows, max_bytes=CHUNK_BYTES, max_rows=CHUNK_ROWS):
+    """
+    Group rows into batches that fit in one append request.
+
+    The size of a batch is estimated on the JSON encoding of its rows.
+
+    Args:
+        rows: An iterable of rows.
+        max_bytes: The largest payload of a batch.
+        max_rows: The largest number of rows in a batch.
+
+    @return
+        generator: Lists of rows.
+    """
+    batch = []
+    size = 0
+    for row in rows:
+        row_size = len(json.dumps(row, default=str)) + 1
+        if batch and (size + row_size > max_bytes or len(batch) >= max_rows):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(row)
+        size += row_size
+    if batch:
+        yield batch
+
+
+def upload_rows(rows, validate, append, recorded_at, progress=None,
+                skip=0):
+    """
+    Upload the valid rows of a file in chunks.
+
+    Invalid rows are skipped; check_rows reports them beforehand. Chunks
+    are uploaded in file order, so after a failure the rows reported by
+    ``progress`` are exactly the first valid rows of the file, and running
+    the import again with that number as ``skip`` uploads the rest once.
+
+    Args:
+        rows: (line number, cells) pairs from read_rows.
+        validate: The task validation function.
+        append: The function appending a batch of rows (retried with
+            backoff on quota and server errors).
+        recorded_at: The Recorded At value of rows that do not have one.
+        progress: Optional function called with the number of rows
+            uploaded so far, counting the skipped ones, after every chunk.
+        skip: The number of valid rows to leave out, uploaded by an
+            earlier, interrupted import of the same file.
+
+    @return
+        int: The number of rows uploaded, counting the skipped ones.
+    """
+    def valid_rows():
+        for _, row in rows:
+            try:
+                task = validate_row(row, validate)
+            except ValueError:
+                continue
+            if len(task) == 5 or not task[5]:
+                task = task[:5] + [recorded_at]
+            yield task
+
+    uploaded = skip
+    for batch in chunks(islice(valid_rows(), skip, None)):
+        call_with_backoff(append, batch)
+        uploaded += len(batch)
+        if progress:
+            progress(uploaded)
+    return uploaded
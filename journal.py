@@ -0,0 +1,434 @@
+"""
+journal.py
+
+This module is part of the Task Logger program. It makes task logging
+offline-first: every task is written to a local append-only journal before
+anything is sent to Google Sheets, and a background thread replicates the
+journal to the sheet in batches.
+
+Logging therefore completes at local-disk speed, whatever the latency or
+availability of the Sheets API, and no task is lost when the API fails or
+the program is closed: pending entries are replayed on the next start.
+
+Several processes may log tasks from the same directory (one run.py per
+web terminal session, the command line next to the worker). Each one owns
+a journal file of its own, locked for as long as it is open: the journal
+path itself, or the first free numbered slot next to it
+(task_journal.1.jsonl, task_journal.2.jsonl, ...). A process therefore
+never rewrites nor uploads the entries of another one. When a journal is
+opened it takes over the entries of the files no running process holds.
+
+Journal format (JSON Lines):
+- {"id": "<hex>", "row": [...]} for a logged task.
+- {"ack": ["<hex>", ...]} once those tasks are in the sheet.
+The file is compacted to the entries still pending when nothing is
+pending any more, or after COMPACT_ACKS acknowledgements.
+"""
+from collections import OrderedDict
+from itertools import count
+import fcntl
+import glob
+import json
+import math
+import os
+import threading
+import uuid
+from task_queue import call_with_backoff
+
+# Acknowledgement lines written before the journal file is compacted
+COMPACT_ACKS = 100
+
+
+def slot_path(path, number):
+    """
+    @return
+        str: The path of journal slot ``number``: ``path`` itself for slot
+        0, ``task_journal.<number>.jsonl`` for the others.
+    """
+    if not number:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{number}{extension}"
+
+
+def existing_slots(path):
+    """
+    @return
+        list: The paths of the journal slots that exist on disk.
+    """
+    root, extension = os.path.splitext(path)
+    slots = [slot for slot in glob.glob(f"{glob.escape(root)}.*{extension}")
+             if slot[len(root) + 1:len(slot) - len(extension)].isdigit()]
+    if os.path.exists(path):
+        slots.insert(0, path)
+    return slots
+
+
+def open_locked(path):
+    """
+    Open a journal file and lock it for this process.
+
+    Returns None if another process holds the lock. A file locked after
+    its owner replaced or removed it is not the journal any more, so the
+    file now at ``path`` is tried instead.
+
+    @return
+        file: The locked file, opened for reading and appending, or None.
+    """
+    while True:
+        journal_file = open(path, "a+b")
+        try:
+            fcntl.flock(journal_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            journal_file.close()
+            return None
+        try:
+            linked = (os.stat(path).st_ino
+                      == os.fstat(journal_file.fileno()).st_ino)
+        except FileNotFoundError:
+            linked = False
+        if linked:
+            return journal_file
+        journal_file.close()
+
+
+def read_pending(journal_file):
+    """
+    Read the entries of a locked journal file that are not acknowledged.
+
+    A line torn by a crash in the middle of a write is cut off the file.
+
+    @return
+        OrderedDict: The pending rows keyed by id, oldest first.
+    """
+    journal_file.seek(0)
+    data = journal_file.read()
+    complete = data.rfind(b"\n") + 1
+    if complete < len(data):
+        # Drop the torn last line left by a crash
+        journal_file.truncate(complete)
+    pending = OrderedDict()
+    for line in data[:complete].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        if "ack" in entry:
+            for entry_id in entry["ack"]:
+                pending.pop(entry_id, None)
+        else:
+            pending[entry["id"]] = entry["row"]
+    return pending
+
+
+def sync_directory(path):
+    """
+    Make a rename in the directory of ``path`` durable.
+
+    @return
+        None
+    """
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+class Journal:
+    """
+    Crash-safe, append-only log of the tasks waiting for replication.
+
+    Every write is flushed and fsync'd before it returns. A line torn by a
+    crash in the middle of a write is discarded when the journal is opened.
+
+    The journal file is locked (flock) from open to close, so no other
+    process writes to it, compacts it or replays it meanwhile. ``path`` is
+    the file actually used, which may be a numbered slot next to the path
+    given.
+
+    Args:
+        path: Path of the journal file.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        for number in count():
+            self.path = slot_path(path, number)
+            self.file = open_locked(self.path)
+            if self.file is not None:
+                break
+        self.pending = read_pending(self.file)
+        self.acks = 0
+        self._adopt(path)
+
+    def _adopt(self, path):
+        """
+        Take over the pending entries of the journal files left by processes
+        that are no longer running, and remove those files.
+
+        The entries keep their ids, so an entry found in two files (a crash
+        while it was being taken over) is replicated once.
+
+        @return
+            None
+        """
+        for slot in existing_slots(path):
+            if slot == self.path:
+                continue
+            orphan = open_locked(slot)
+            if orphan is None:
+                continue  # Another running process owns it
+            with orphan:
+                entries = [{"id": entry_id, "row": row}
+                           for entry_id, row in read_pending(orphan).items()
+                           if entry_id not in self.pending]
+                if entries:
+                    self._write_lines(entries)
+                    for entry in entries:
+                        self.pending[entry["id"]] = entry["row"]
+                os.remove(slot)
+
+    def _write_lines(self, entries):
+        self.file.write("".join(json.dumps(entry) + "\n"
+                                for entry in entries).encode("utf-8"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _compact(self):
+        """
+        Rewrite the journal file with the pending entries only.
+
+        The new file is locked before it is renamed over the old one, so
+        the journal is never unlocked, and a crash leaves either file
+        complete.
+
+        @return
+            None
+        """
+        temporary = f"{self.path}.tmp"
+        compacted = open(temporary, "w+b")
+        fcntl.flock(compacted, fcntl.LOCK_EX)
+        compacted.write("".join(
+            json.dumps({"id": entry_id, "row": row}) + "\n"
+            for entry_id, row in self.pending.items()).encode("utf-8"))
+        compacted.flush()
+        os.fsync(compacted.fileno())
+        os.replace(temporary, self.path)
+        sync_directory(self.path)
+        self.file.close()
+        self.file = compacted
+        self.acks = 0
+
+    def __len__(self):
+        with self.lock:
+            return len(self.pending)
+
+    def write_many(self, rows):
+        """
+        Durably record tasks waiting for replication.
+
+        Args:
+            rows: A list of rows, each one a list of cell values.
+
+        @return
+            list: The ids given to the rows.
+        """
+        with self.lock:
+            entries = [{"id": uuid.uuid4().hex, "row": row} for row in rows]
+            self._write_lines(entries)
+            for entry in entries:
+                self.pending[entry["id"]] = entry["row"]
+            return [entry["id"] for entry in entries]
+
+    def write(self, row):
+        """
+        Durably record one task waiting for replication.
+
+        @return
+            str: The id given to the row.
+        """
+        return self.write_many([row])[0]
+
+    def pending_entries(self, limit=None):
+        """
+        @return
+            list: Up to ``limit`` (id, row) pairs, oldest first.
+        """
+        with self.lock:
+            entries = list(self.pending.items())
+        return entries[:limit] if limit else entries
+
+    def ack(self, ids):
+        """
+        Mark tasks as replicated.
+
+        The journal file is compacted to the entries still pending once
+        nothing is pending any more, or every COMPACT_ACKS acknowledgements.
+
+        Args:
+            ids: The ids of the replicated rows.
+
+        @return
+            None
+        """
+        with self.lock:
+            for entry_id in ids:
+                self.pending.pop(entry_id, None)
+            self._write_lines([{"ack": list(ids)}])
+            self.acks += 1
+            if not self.pending or self.acks >= COMPACT_ACKS:
+                self._compact()
+
+    def close(self):
+        """
+        Close the journal file, releasing it to the next process.
+        """
+        with self.lock:
+            self.file.close()
+
+
+def same_row(row, record):
+    """
+    Tell whether a journal row and a cached record hold the same task.
+
+    @return
+        bool: True if every cell matches (hours compared as numbers).
+    """
+    values = list(record.values())
+    try:
+        same_hours = math.isclose(float(row[3]), float(values[3]))
+    except (TypeError, ValueError):
+        same_hours = str(row[3]) == str(values[3])
+    return same_hours and all(
+        str(row[i]) == str(values[i]) for i in (0, 1, 2, 4, 5)
+    )
+
+
+class Replicator(threading.Thread):
+    """
+    Background thread replicating the journal to the task log in batches.
+
+    It wakes up when notified of new entries (or every ``interval``
+    seconds), uploads up to ``batch_size`` rows per batched append and
+    acknowledges them. After a failure it waits longer before trying again,
+    up to one minute.
+
+    Args:
+        journal: The Journal to replicate.
+        cache: The RecordCache whose append_many uploads the rows.
+        batch_size: The maximum number of rows per append.
+        interval: Seconds between two checks of the journal.
+    """
+
+    def __init__(self, journal, cache, batch_size=500, interval=5.0):
+        super().__init__(daemon=True)
+        self.journal = journal
+        self.cache = cache
+        self.batch_size = batch_size
+        self.interval = interval
+        self.wake = threading.Event()
+        self.stopping = False
+        self.last_error = None
+
+    def notify(self):
+        """
+        Ask the thread to replicate new entries now.
+        """
+        self.wake.set()
+
+    def reconcile(self):
+        """
+        Acknowledge pending entries that already reached the task log.
+
+        This covers a crash between a successful upload and the write of
+        its acknowledgement, so those tasks are not uploaded twice. Only
+        cached records with the same "Recorded At" as a pending entry are
+        compared.
+
+        @return
+            int: The number of entries acknowledged.
+        """
+        entries = self.journal.pending_entries()
+        if not entries:
+            return 0
+        self.cache.sync()
+        wanted = {str(row[5]) for _, row in entries if len(row) > 5}
+        candidates = [
+            self.cache.record(position)
+            for position, recorded in enumerate(self.cache.recorded)
+            if recorded in wanted
+        ]
+        done = [
+            entry_id for entry_id, row in entries
+            if any(same_row(row, record) for record in candidates)
+        ]
+        if done:
+            self.journal.ack(done)
+        return len(done)
+
+    def replicate_once(self):
+        """
+        Upload one batch of pending entries and acknowledge it.
+
+        @return
+            int: The number of rows uploaded.
+
+        Raises:
+            gspread.exceptions.APIError: If the upload fails after retrying.
+        """
+        entries = self.journal.pending_entries(self.batch_size)
+        if not entries:
+            return 0
+        call_with_backoff(self.cache.append_many,
+                          [row for _, row in entries])
+        self.journal.ack([entry_id for entry_id, _ in entries])
+        return len(entries)
+
+    def replicate_all(self):
+        """
+        Upload every pending entry, batch after batch.
+
+        @return
+            int: The number of rows uploaded.
+        """
+        uploaded = 0
+        while True:
+            count = self.replicate_once()
+            if not count:
+                return uploaded
+            uploaded += count
+
+    def run(self):
+        delay = self.interval
+        reconciled = False
+        while True:
+            try:
+                if not reconciled:
+                    self.reconcile()
+                    reconciled = True
+                self.replicate_all()
+                self.last_error = None
+                delay = self.interval
+            except Exception as e:
+                # Keep the entries and try again later
+                self.last_error = e
+                delay = min(delay * 2, 60.0)
+            if self.stopping:
+                return
+            self.wake.wait(delay)
+            self.wake.clear()
+
+    def stop(self, timeout=None):
+        """
+        Make a last replication attempt and stop the thread.
+
+        Args:
+            timeout: Seconds to wait for the last attempt.
+
+        @return
+            int: The number of entries still pending.
+        """
+        self.stopping = True
+        self.wake.set()
+        self.join(timeout)
+        return len(self.journal)
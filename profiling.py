@@ -0,0 +1,189 @@
+"""
+profiling.py
+
+This module is part of the Task Logger program. It provides a lightweight
+instrumentation layer to see where time and Sheets API quota go.
+
+Features:
+- Wrap the worksheet (or any storage object) so every call is counted and
+  timed, together with the rows and bytes it transferred.
+- Time the top-level actions of the menu and of the command line.
+- Print a summary table or dump everything as JSON.
+"""
+from contextlib import contextmanager
+import json
+import threading
+import time
+from prettytable import PrettyTable
+
+
+def payload_size(value):
+    """
+    Estimate the number of rows and bytes in a call argument or result.
+
+    Args:
+        value: A list of rows, a single row, a dictionary or a scalar.
+
+    @return
+        tuple: (rows, bytes). Bytes are measured on the JSON encoding,
+        which is what travels over the Sheets API.
+    """
+    if value is None:
+        return 0, 0
+    if isinstance(value, list):
+        rows = len(value) if not value or isinstance(value[0], list) else 1
+    else:
+        rows = 0
+    return rows, len(json.dumps(value, default=str))
+
+
+class Profiler:
+    """
+    Collects call and action statistics.
+
+    Each entry holds the number of calls, the total and maximum wall-clock
+    time in seconds, and the rows and bytes sent and received.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.actions = {}
+
+    @staticmethod
+    def _entry(table, name):
+        return table.setdefault(name, {
+            "count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0,
+            "rows_sent": 0, "rows_received": 0,
+            "bytes_sent": 0, "bytes_received": 0,
+        })
+
+    def record_call(self, name, seconds, sent, received, failed=False):
+        """
+        Record one call to the instrumented object.
+
+        Args:
+            name: The method name.
+            seconds: The wall-clock duration of the call.
+            sent: (rows, bytes) sent with the call.
+            received: (rows, bytes) returned by the call.
+            failed: Whether the call raised an exception.
+
+        @return
+            None
+        """
+        with self.lock:
+            entry = self._entry(self.calls, name)
+            entry["count"] += 1
+            entry["errors"] += int(failed)
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["rows_sent"] += sent[0]
+            entry["bytes_sent"] += sent[1]
+            entry["rows_received"] += received[0]
+            entry["bytes_received"] += received[1]
+
+    @contextmanager
+    def action(self, name):
+        """
+        Time a top-level action, e.g. a menu entry.
+
+        Args:
+            name: The action name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                entry = self._entry(self.actions, name)
+                entry["count"] += 1
+                entry["seconds"] += seconds
+                entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def to_dict(self):
+        """
+        @return
+            dict: A copy of the collected statistics.
+        """
+        with self.lock:
+            return {
+                "calls": {name: dict(e) for name, e in self.calls.items()},
+                "actions": {name: dict(e) for name, e in self.actions.items()},
+            }
+
+    def summary(self):
+        """
+        Render the collected statistics as two tables.
+
+        @return
+            str: The API call table followed by the action table.
+        """
+        data = self.to_dict()
+        calls = PrettyTable()
+        calls.title = "Storage calls"
+        calls.field_names = ["Call", "Count", "Errors", "Total ms", "Max ms",
+                             "Rows in", "Rows out", "KB in", "KB out"]
+        for name, e in sorted(data["calls"].items()):
+            calls.add_row([
+                name, e["count"], e["errors"], f"{e['seconds'] * 1000:.1f}",
+                f"{e['max_seconds'] * 1000:.1f}", e["rows_received"],
+                e["rows_sent"], f"{e['bytes_received'] / 1024:.1f}",
+                f"{e['bytes_sent'] / 1024:.1f}",
+            ])
+        actions = PrettyTable()
+        actions.title = "Actions"
+        actions.field_names = ["Action", "Count", "Total ms", "Max ms"]
+        for name, e in sorted(data["actions"].items()):
+            actions.add_row([
+                name, e["count"], f"{e['seconds'] * 1000:.1f}",
+                f"{e['max_seconds'] * 1000:.1f}",
+            ])
+        return f"{calls}\n{actions}"
+
+    def dump(self, path):
+        """
+        Write the collected statistics to a JSON file.
+
+        Args:
+            path: The output file path.
+
+        @return
+            None
+        """
+        with open(path, "w", encoding="utf-8") as output:
+            json.dump(self.to_dict(), output, indent=2)
+
+
+class Instrumented:
+    """
+    Proxy that records every method call made on the wrapped object.
+
+    Attribute reads other than methods are passed through unchanged, so the
+    proxy can stand in for a gspread Worksheet or a storage backend.
+    """
+
+    def __init__(self, target, profiler):
+        self._target = target
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            sent = payload_size(args[0]) if args else (0, 0)
+            start = time.perf_counter()
+            try:
+                result = attribute(*args, **kwargs)
+            except Exception:
+                self._profiler.record_call(
+                    name, time.perf_counter() - start, sent, (0, 0), True)
+                raise
+            self._profiler.record_call(name, time.perf_counter() - start,
+                                       sent, payload_size(result))
+            return result
+
+        return call
@@ -0,0 +1,208 @@
+"""
+query.py
+
+This module is part of the Task Logger program. It answers statistics
+queries over the record cache that go beyond a single month: arbitrary date
+ranges across years, grouped by any combination of collaborator, task type
+and date bucket (day, ISO week, month, year).
+
+Features:
+- A date-sorted index of the cached records, kept up to date as records
+  are appended, with binary-search range selection.
+- Group-by over Name, Type, Day, Week, Month and Year.
+- Results of several caches (live and archived months) merged into one.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date
+from functools import lru_cache
+import math
+
+# Date buckets available for grouping, computed from packed YYYYMMDD dates
+DATE_DIMENSIONS = ("Day", "Week", "Month", "Year")
+DIMENSIONS = ("Name", "Type") + DATE_DIMENSIONS
+
+
+@lru_cache(maxsize=8192)
+def date_bucket(packed, dimension):
+    """
+    Label the date bucket of a packed YYYYMMDD date.
+
+    Args:
+        packed: The packed date.
+        dimension: One of DATE_DIMENSIONS.
+
+    @return
+        str: e.g. "2024-05-17", "2024-W20", "2024-05" or "2024".
+    """
+    year, month, day = packed // 10000, packed // 100 % 100, packed % 100
+    if dimension == "Day":
+        return f"{year}-{month:02d}-{day:02d}"
+    if dimension == "Week":
+        iso_year, iso_week, _ = date(year, month, day).isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+    if dimension == "Month":
+        return f"{year}-{month:02d}"
+    return str(year)
+
+
+class DateIndex:
+    """
+    Positions of the cached records sorted by date.
+
+    ``dates`` holds the packed dates in ascending order and ``positions``
+    the matching record positions, so the records of any date range are
+    found with two binary searches. Records with a malformed date (packed
+    as 0) are left out.
+
+    The index follows the cache: records appended in date order are added
+    at the end, anything else triggers a rebuild on the next query.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.source = None
+        self.dates = array("I")
+        self.positions = array("I")
+        self.indexed = 0
+
+    def refresh(self):
+        """
+        Bring the index up to date with the cache.
+
+        @return
+            None
+        """
+        cache_dates = self.cache.dates
+        count = len(cache_dates)
+        if cache_dates is not self.source:
+            # The cache was (re)loaded: index it from scratch
+            self.source = cache_dates
+            self.indexed = 0
+        new = [p for p in range(self.indexed, count) if cache_dates[p]]
+        last = self.dates[-1] if self.dates else 0
+        if self.indexed and all(cache_dates[p] >= last for p in new):
+            new.sort(key=cache_dates.__getitem__)
+            self.positions.extend(new)
+            self.dates.extend(cache_dates[p] for p in new)
+        elif new or not self.indexed:
+            ordered = sorted(
+                (p for p in range(count) if cache_dates[p]),
+                key=cache_dates.__getitem__,
+            )
+            self.positions = array("I", ordered)
+            self.dates = array("I", (cache_dates[p] for p in ordered))
+        self.indexed = count
+
+    def select(self, start=None, end=None):
+        """
+        Return the positions of the records dated within a range.
+
+        Args:
+            start: The first packed date included, or None for no bound.
+            end: The last packed date included, or None for no bound.
+
+        @return
+            array: The matching record positions, in date order.
+        """
+        self.refresh()
+        low = bisect_left(self.dates, start) if start else 0
+        high = bisect_right(self.dates, end) if end else len(self.dates)
+        return self.positions[low:high]
+
+
+def run_query(cache, index, start=None, end=None, group_by=("Name",)):
+    """
+    Aggregate the hours of the records in a date range by the given groups.
+
+    Args:
+        cache: The RecordCache holding the records.
+        index: The DateIndex of that cache.
+        start: The first packed YYYYMMDD date included, or None.
+        end: The last packed YYYYMMDD date included, or None.
+        group_by: A sequence of DIMENSIONS to group by (may be empty).
+
+    @return
+        tuple: (rows, invalid) where rows is a list of
+        (group values tuple, hours, task count) sorted by group, and invalid
+        is the number of records in range whose hours are not a positive
+        number (see records.valid_hours).
+
+    Raises:
+        ValueError: If a grouping dimension is unknown.
+    """
+    for dimension in group_by:
+        if dimension not in DIMENSIONS:
+            raise ValueError(
+                f"Unknown group '{dimension}'. Use {', '.join(DIMENSIONS)}.")
+
+    with cache.lock:
+        positions = index.select(start, end)
+        columns = {
+            "Name": cache.names,
+            "Type": cache.types,
+        }
+        # Group on integer codes and packed dates; labels are built once
+        # per group afterwards
+        key_columns = [
+            columns.get(dimension, cache.dates) for dimension in group_by
+        ]
+        hours_column = cache.hours
+        hours = defaultdict(float)
+        counts = defaultdict(int)
+        invalid = 0
+        keys = zip(*(map(column.__getitem__, positions)
+                     for column in key_columns))
+        if not key_columns:
+            keys = (() for _ in positions)
+        for key, value in zip(keys, map(hours_column.__getitem__, positions)):
+            if not 0 < value < math.inf:  # records.valid_hours, inlined
+                invalid += 1
+                continue
+            hours[key] += value
+            counts[key] += 1
+
+        labels = {
+            "Name": cache.name_table.values.__getitem__,
+            "Type": cache.type_table.values.__getitem__,
+        }
+        merged_hours = defaultdict(float)
+        merged_counts = defaultdict(int)
+        for key, value in hours.items():
+            label = tuple(
+                labels[dimension](part) if dimension in labels
+                else date_bucket(part, dimension)
+                for dimension, part in zip(group_by, key)
+            )
+            merged_hours[label] += value
+            merged_counts[label] += counts[key]
+
+    rows = [
+        (label, merged_hours[label], merged_counts[label])
+        for label in sorted(merged_hours)
+    ]
+    return rows, invalid
+
+
+def merge_results(results):
+    """
+    Combine the results of one query run over several caches, e.g. the
+    live task log and the partitions of archived months.
+
+    Args:
+        results: (rows, invalid) pairs as returned by run_query.
+
+    @return
+        tuple: (rows, invalid), as returned by run_query.
+    """
+    hours = defaultdict(float)
+    counts = defaultdict(int)
+    invalid = 0
+    for rows, result_invalid in results:
+        invalid += result_invalid
+        for label, value, count in rows:
+            hours[label] += value
+            counts[label] += count
+    return [(label, hours[label], counts[label])
+            for label in sorted(hours)], invalid
@@ -0,0 +1,648 @@
+"""
+records.py
+
+This module is part of the Task Logger program. It keeps an in-process copy
+of the task log so that menu actions do not download the whole storage
+(normally the Google Sheet) every time they need the records.
+
+Features:
+- Load the task log once and keep the header row and records in memory.
+- Write-through appends: rows logged by this session are added in place.
+- Incremental tail sync that fetches only the rows appended since the
+  last read.
+- Month buckets built while loading, so selecting a month is a lookup.
+- Monthly aggregate index (hours per type, per collaborator and in total)
+  maintained as records enter the cache.
+- Column-wise storage: hours in a float array, dates packed into integers
+  and names/types interned into small integer codes.
+- Warm start from a local snapshot of the columns (see snapshot.py),
+  checked against the storage (its revision, or the cells of the last
+  cached row) and brought up to date with one range read.
+- Data-quality scan while loading: every record with a malformed date,
+  hours that are not a positive number, an empty name or task, or an
+  unknown task type is flagged by row, and those whose date or hours
+  cannot be aggregated are kept out of the statistics.
+"""
+from array import array
+from collections import defaultdict
+from collections.abc import Sequence
+from datetime import datetime
+from functools import lru_cache
+from itertools import compress, count
+import math
+import threading
+
+HEADERS = ["Name", "Task", "Date", "Hours", "Type", "Recorded At"]
+TASK_TYPES = ["Administrative", "Marketing", "Product"]
+
+# Data-quality issues of a record, as bit flags
+BAD_DATE = 1
+BAD_HOURS = 2
+NO_NAME = 4
+NO_TASK = 8
+UNKNOWN_TYPE = 16
+# Issues that keep a record out of the statistics; the others are only
+# reported
+QUARANTINED = BAD_DATE | BAD_HOURS
+ISSUES = {
+    BAD_DATE: "malformed date",
+    BAD_HOURS: "hours not a positive number",
+    NO_NAME: "empty name",
+    NO_TASK: "empty task",
+    UNKNOWN_TYPE: "unknown task type",
+}
+
+
+@lru_cache(maxsize=4096)
+def pack_date(value):
+    """
+    Pack a DD-MM-YYYY date string into an integer YYYYMMDD.
+
+    A task log only holds a few hundred distinct dates, so results are
+    memoized and each distinct string is parsed once.
+
+    Args:
+        value: The date string.
+
+    @return
+        int: The packed date, or 0 if the date is malformed.
+    """
+    try:
+        date = datetime.strptime(value, "%d-%m-%Y")
+    except (TypeError, ValueError):
+        return 0
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+def format_date(packed):
+    """
+    Turn a packed YYYYMMDD integer back into a DD-MM-YYYY string.
+
+    @return
+        str: The formatted date.
+    """
+    return f"{packed % 100:02d}-{packed // 100 % 100:02d}-{packed // 10000}"
+
+
+@lru_cache(maxsize=4096)
+def parse_hours(value):
+    """
+    Convert an Hours cell to a float.
+
+    Like dates, hours repeat a few values over and over, so results are
+    memoized and each distinct string is parsed once.
+
+    @return
+        float: The hours, or NaN if the cell is not a number.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def valid_hours(hours):
+    """
+    @return
+        bool: Whether parsed hours can be added to the statistics: a
+        positive, finite number.
+    """
+    return 0 < hours < math.inf
+
+
+def describe_issues(flags):
+    """
+    @return
+        str: The data-quality issues of a record, comma separated.
+    """
+    return ", ".join(message for flag, message in ISSUES.items()
+                     if flags & flag)
+
+
+def row_cells(row):
+    """
+    @return
+        list: The first six cells of a row as strings, without trailing
+        empty cells, the way a range read returns them.
+    """
+    cells = [str(value) for value in row[:6]]
+    while cells and not cells[-1]:
+        cells.pop()
+    return cells
+
+
+def new_month_stats():
+    """
+    Create an empty aggregate entry for one month.
+
+    @return
+        dict: A dictionary with:
+            - types (defaultdict): Hours per task type.
+            - collaborators (defaultdict): Hours per collaborator.
+            - total (float): Total hours of the month.
+            - invalid (int): Records skipped because Hours is not a positive
+              number.
+    """
+    return {
+        "types": defaultdict(float),
+        "collaborators": defaultdict(float),
+        "total": 0.0,
+        "invalid": 0,
+    }
+
+
+class Interner:
+    """
+    Maps repeated strings (names, task types) to small integer codes.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        """
+        @return
+            int: The code of ``value``, assigning a new one if needed.
+        """
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class Records(Sequence):
+    """
+    Read-only sequence of record dictionaries over the cache columns.
+
+    Dictionaries are built only for the records actually accessed, so
+    slicing, counting or paging never materializes the whole task log.
+
+    Args:
+        cache: The RecordCache holding the columns.
+        positions: The record positions in this view (a range or an
+            array of positions).
+    """
+
+    def __init__(self, cache, positions):
+        self.cache = cache
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Records(self.cache, self.positions[index])
+        return self.cache.record(self.positions[index])
+
+
+class RecordCache:
+    """
+    In-memory copy of the task log held by a storage backend.
+
+    The cache remembers the index of the last sheet row it has seen
+    (``last_row``, where the header is row 1). Rows are only ever appended
+    to the task log, so bringing the cache up to date means fetching the
+    range that starts right after that row: the cost of a sync is
+    proportional to the number of new rows, not to the size of the sheet.
+
+    Records are held column-wise rather than as a list of dictionaries:
+    ``hours`` is a float array, ``dates`` packs each date into a YYYYMMDD
+    integer, and ``names``/``types`` hold integer codes into interned
+    string tables. Cells that cannot be parsed keep their original text in
+    ``raw_cells`` so they are still displayed as entered.
+
+    Rows are checked while they are parsed: ``issues`` maps the position of
+    every record with a data-quality problem to its flags (BAD_DATE,
+    BAD_HOURS, ...). Records with a QUARANTINED issue stay viewable but
+    never reach the aggregates, so the statistics run over clean, already
+    typed values.
+
+    Every record is also filed in ``months``, a dictionary of position
+    arrays keyed by (year, month), as it enters the cache. ``stats`` holds
+    the aggregates of each month, updated in the same pass, so showing the
+    statistics of a month costs O(number of types and collaborators)
+    instead of O(number of records).
+
+    Loading, syncing and appending hold ``lock``, so the cache can be warmed
+    up by a background thread while the menu is in use. ``generation`` is
+    increased whenever records enter or leave the cache, so readers that
+    derive data from it (the report server) can tell when to rebuild.
+
+    With a storage whose revision only changes on edits and deletes
+    (SQLite), ``revision`` is the revision (see Storage.revision) the cache
+    is known to match, and every sync checks it before the tail read: if
+    it has changed, rows above the tail may have been edited or deleted and
+    the task log is loaded again.
+
+    Appends change the revision of a Google Sheet, so it cannot tell edits
+    from appends. There ``tail`` holds the cells of the row at
+    ``last_row`` as last read, and the tail read starts at that row: if it
+    no longer comes back first, rows were deleted or the last row edited,
+    and the task log is loaded again. ``tail`` is None after this process
+    appends (the sheet may render the values differently) until the next
+    read. A cache restored from a snapshot is checked the same way, so it
+    is only brought up to date with the rows appended since.
+
+    Archiving deletes rows from the live task log, so the rows appended
+    after it land below ``last_row``. When ``epoch`` is given, every sync
+    reads it (the archive epoch, see archive.Partitions.epoch, which may
+    cache it briefly) and loads the task log again if it has changed since
+    the cache was loaded.
+
+    Args:
+        storage: The Storage holding the task log.
+        epoch: Optional function returning the archive epoch.
+    """
+
+    def __init__(self, storage, epoch=None):
+        self.storage = storage
+        self.read_epoch = epoch
+        self.headers = []
+        self.last_row = 0
+        self.revision = None
+        self.tail = None
+        self.epoch = None
+        self.loaded = False
+        self.verified = True
+        self.lock = threading.RLock()
+        self.generation = 0
+        self._reset()
+
+    def _reset(self):
+        """
+        Empty the columns and indexes.
+
+        @return
+            None
+        """
+        self.names = array("I")
+        self.tasks = []
+        self.dates = array("I")
+        self.hours = array("d")
+        self.types = array("I")
+        self.recorded = []
+        self.name_table = Interner()
+        self.type_table = Interner()
+        self.raw_cells = {}
+        self.issues = {}
+        self.months = defaultdict(lambda: array("I"))
+        self.stats = defaultdict(new_month_stats)
+        self.generation += 1
+
+    def __len__(self):
+        return len(self.hours)
+
+    @property
+    def records(self):
+        """
+        @return
+            Records: A view of every cached record, in sheet order.
+        """
+        return Records(self, range(len(self)))
+
+    def record_keys(self):
+        """
+        @return
+            list: The keys of the record dictionaries (the sheet headers,
+            or the expected headers if the sheet has fewer columns).
+        """
+        return self.headers[:6] if len(self.headers) >= 6 else HEADERS
+
+    def record(self, position):
+        """
+        Build the dictionary of one cached record.
+
+        Args:
+            position: The position of the record in the cache.
+
+        @return
+            dict: The record keyed by the header names.
+        """
+        with self.lock:
+            return dict(zip(self.record_keys(), self.row(position)))
+
+    def row(self, position):
+        """
+        Build the values of one cached record, without the dictionary.
+
+        Args:
+            position: The position of the record in the cache.
+
+        @return
+            tuple: Name, Task, Date, Hours (an int when whole), Type and
+            Recorded At.
+        """
+        # Under the lock: an append fills the columns one after the other
+        # and a reload replaces them all
+        with self.lock:
+            packed = self.dates[position]
+            hours = self.hours[position]
+            if math.isnan(hours):
+                hours = self.raw_cells.get((position, 3), "")
+            elif hours.is_integer():
+                hours = int(hours)
+            return (
+                self.name_table.values[self.names[position]],
+                self.tasks[position],
+                format_date(packed) if packed
+                else self.raw_cells.get((position, 2), ""),
+                hours,
+                self.type_table.values[self.types[position]],
+                self.recorded[position],
+            )
+
+    def _add_rows(self, rows):
+        """
+        Parse raw rows into the columns, check them, file them in their
+        month bucket and add their hours to the month aggregates.
+
+        Each column is parsed in one pass (dates and hours through memoized
+        parsers) and the rows are checked in another, before anything is
+        aggregated. Records with a malformed date are kept for viewing but
+        are not filed in any month; records whose hours are not a positive
+        number are counted as invalid in their month instead of being added
+        to the totals.
+
+        Args:
+            rows: A list of rows, each one a list of cell strings.
+
+        @return
+            None
+        """
+        if not rows:
+            return
+        self.generation += 1
+        start = len(self.hours)
+        rows = [row if len(row) >= 6 else list(row) + [""] * (6 - len(row))
+                for row in rows]
+        names, tasks, dates, hours_cells, task_types, recorded = (
+            [row[column] for row in rows] for column in range(6))
+
+        packed_dates = array("I", map(pack_date, dates))
+        hours = array("d", map(parse_hours, hours_cells))
+        known_types = set(TASK_TYPES)
+        flags = [
+            (not packed) * BAD_DATE
+            | (not 0 < value < math.inf) * BAD_HOURS
+            | (not name.strip()) * NO_NAME
+            | (not task.strip()) * NO_TASK
+            | (task_type not in known_types) * UNKNOWN_TYPE
+            for packed, value, name, task, task_type
+            in zip(packed_dates, hours, names, tasks, task_types)
+        ]
+
+        for offset in compress(range(len(flags)), flags):
+            position = start + offset
+            self.issues[position] = flags[offset]
+            if flags[offset] & BAD_DATE:
+                self.raw_cells[(position, 2)] = dates[offset]
+            if math.isnan(hours[offset]):
+                self.raw_cells[(position, 3)] = hours_cells[offset]
+
+        self.names.extend(map(self.name_table.code, names))
+        self.tasks.extend(tasks)
+        self.dates.extend(packed_dates)
+        self.hours.extend(hours)
+        self.types.extend(map(self.type_table.code, task_types))
+        self.recorded.extend(recorded)
+
+        for position, packed, flag, value, name, task_type in zip(
+                count(start), packed_dates, flags, hours, names, task_types):
+            if not packed:
+                continue
+            key = divmod(packed // 100, 100)
+            self.months[key].append(position)
+            month_stats = self.stats[key]
+            if flag & QUARANTINED:
+                month_stats["invalid"] += 1
+                continue
+            month_stats["types"][task_type] += value
+            month_stats["collaborators"][name] += value
+            month_stats["total"] += value
+
+    def issue_rows(self):
+        """
+        List the records flagged by the data-quality scan.
+
+        @return
+            list: (row number, flags) pairs in sheet order, where the row
+            number counts the header as row 1 (with several sheets, it is
+            the row of the combined task log).
+        """
+        with self.lock:
+            return [(position + 2, flags)
+                    for position, flags in sorted(self.issues.items())]
+
+    def records_for_month(self, year, month):
+        """
+        Return the cached records dated in the given month.
+
+        Args:
+            year: The four digit year.
+            month: The month number (1-12).
+
+        @return
+            Records: The records of that month (empty if there are none).
+        """
+        return Records(self, self.months.get((year, month), array("I")))
+
+    def page_count(self, size):
+        """
+        Return the number of pages of ``size`` records in the cache.
+
+        @return
+            int: The page count (at least 1).
+        """
+        return max(1, -(-len(self) // size))
+
+    def page(self, number, size, newest_first=True):
+        """
+        Return the records of one page without building the others.
+
+        Args:
+            number: The page number, starting at 1.
+            size: The number of records per page.
+            newest_first: Whether page 1 holds the most recent records.
+
+        @return
+            list: The record dictionaries of the page, in display order.
+        """
+        with self.lock:
+            if not newest_first:
+                positions = range(len(self))[(number - 1) * size:
+                                             number * size]
+            else:
+                end = len(self) - (number - 1) * size
+                positions = range(max(end - size, 0), max(end, 0))[::-1]
+            return [self.record(position) for position in positions]
+
+    def month_stats(self, year, month):
+        """
+        Return the precomputed aggregates of the given month.
+
+        Args:
+            year: The four digit year.
+            month: The month number (1-12).
+
+        @return
+            dict: The month aggregates (see new_month_stats), or None if
+            no record is dated in that month.
+        """
+        return self.stats.get((year, month))
+
+    def load(self):
+        """
+        Download the whole task log and replace the cached records.
+
+        @return
+            None
+        """
+        with self.lock:
+            # Read before the rows, so a change made while they are read
+            # shows as a new revision or epoch on the next check
+            epoch = self.read_epoch() if self.read_epoch else None
+            revision = None
+            if not self.storage.APPENDS_CHANGE_REVISION:
+                revision = self.storage.revision()
+            values = self.storage.read_all()
+            self.headers = values[0] if values else []
+            self._reset()
+            self._add_rows(values[1:])
+            self.last_row = len(values)
+            self.revision = revision
+            self.tail = row_cells(values[-1]) if values else None
+            self.epoch = epoch
+            self.loaded = True
+            self.verified = True
+
+    def sync(self):
+        """
+        Fetch only the rows appended since the last read.
+
+        Requests the open-ended range ``A{last_row + 1}:F`` and adds the
+        rows it returns to the cache; with a storage whose appends change
+        its revision, the range starts at ``last_row`` to check the tail
+        row first. Falls back to a full load if the cache has never been
+        loaded, if rows were archived since the cache was loaded, or if
+        the storage was edited (see the class description).
+
+        @return
+            int: The number of new rows added to the cache.
+        """
+        with self.lock:
+            if not self.loaded:
+                self.load()
+                return len(self)
+
+            epoch = self.read_epoch() if self.read_epoch else None
+            if epoch != self.epoch:
+                self.load()
+                return len(self)
+            check_tail = (self.storage.APPENDS_CHANGE_REVISION
+                          and self.storage.TAIL_CHECK and self.last_row)
+            if not self.storage.APPENDS_CHANGE_REVISION:
+                revision = self.storage.revision()
+                if revision is None or revision != self.revision:
+                    self.load()
+                    return len(self)
+
+            if check_tail:
+                rows = self.storage.read_range(self.last_row)
+                first = row_cells(rows[0]) if rows else []
+                if self.tail is not None and first != self.tail:
+                    # Rows were deleted or the last one edited
+                    self.load()
+                    return len(self)
+                if rows:
+                    self.tail = first
+                rows = rows[1:]
+            else:
+                rows = self.storage.read_range(self.last_row + 1)
+            self.verified = True
+            self.epoch = epoch
+            if not rows:
+                return 0
+
+            self.last_row += len(rows)
+            self.tail = row_cells(rows[-1])
+            if not self.headers:
+                # The first row fetched from an empty sheet is the header row
+                self.headers = rows[0]
+                rows = rows[1:]
+            self._add_rows(rows)
+            return len(rows)
+
+    def checkable(self):
+        """
+        @return
+            bool: Whether a snapshot of the cache could be checked against
+            the storage when it is restored (see the class description).
+        """
+        if not self.loaded or not self.verified:
+            return False
+        if self.storage.APPENDS_CHANGE_REVISION:
+            return self.storage.TAIL_CHECK and self.tail is not None
+        return self.revision is not None
+
+    def get_records(self):
+        """
+        Return the cached records after syncing the tail of the sheet.
+
+        @return
+            Records: A view of every cached record.
+        """
+        self.sync()
+        return self.records
+
+    def set_headers(self, headers):
+        """
+        Write the header row to an empty storage and record it in the cache.
+
+        Args:
+            headers: The list of column names.
+
+        @return
+            None
+        """
+        with self.lock:
+            self.last_row = self.storage.set_header(headers)
+            self.headers = list(headers)
+            self.tail = None
+
+    def append(self, row):
+        """
+        Append a row to the sheet and add it to the cache in place.
+
+        Args:
+            row: The list of cell values to append.
+
+        @return
+            None
+        """
+        self.append_many([row])
+
+    def append_many(self, rows):
+        """
+        Append several rows with one batched call and cache them in place.
+
+        If the sheet placed the rows anywhere other than straight after the
+        last cached row (somebody else appended in the meantime), they are
+        left for the next sync, which fetches them together with the rows
+        that were appended before them.
+
+        Args:
+            rows: A list of rows, each one a list of cell values.
+
+        @return
+            None
+        """
+        with self.lock:
+            row_index = self.storage.append_many(rows)
+            if self.loaded and row_index == self.last_row + 1:
+                rows = [[str(value) for value in row] for row in rows]
+                self._add_rows(rows)
+                self.last_row = row_index + len(rows) - 1
+                self.tail = None
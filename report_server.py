@@ -0,0 +1,314 @@
+"""
+report_server.py
+
+This script is part of the Task Logger program. It serves the monthly
+statistics as read-only JSON over HTTP, for managers' dashboards, without
+going through the terminal menu.
+
+Every report is built from the shared record cache and its monthly
+aggregate index (plus the archive manifest), never from a request: a
+background task brings the cache up to date every REFRESH_SECONDS with a
+tail read, and the reports are rebuilt only when the cache has changed.
+A request is a dictionary lookup, so one process answers hundreds of
+concurrent polls. Every report carries an ETag; a poll sending it back in
+If-None-Match gets an empty 304 Not Modified while the data is unchanged.
+
+Endpoints:
+- GET /stats: every month with its tasks, total and invalid hours.
+- GET /stats/YYYY-MM: the hours per type and per collaborator of a month.
+
+Usage:
+- python3 report_server.py [--host HOST] [--port PORT] [--refresh SECONDS]
+- python3 server.py --report-port PORT, to serve the reports from the
+  terminal worker, sharing its record cache.
+"""
+from email.utils import formatdate
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from archive import month_label
+import run
+
+REFRESH_SECONDS = 30
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_SECONDS = 60
+MAX_HEADER_LINES = 100
+STATUS = {200: "OK", 304: "Not Modified", 400: "Bad Request",
+          404: "Not Found", 405: "Method Not Allowed"}
+
+
+def month_report(year, month):
+    """
+    Build the report of one month.
+
+    @return
+        dict: The month, tasks, total and invalid hours and the hours per
+        type and per collaborator, or None if no record is dated in it.
+    """
+    month_stats = run.month_statistics(year, month)
+    if not month_stats:
+        return None
+    tasks = month_stats.get("tasks")
+    if tasks is None:  # Live month only
+        tasks = len(run.CACHE.months.get((year, month), ()))
+    return {
+        "month": month_label(year * 100 + month),
+        "archived": run.archived_month(year, month) is not None,
+        "tasks": tasks,
+        "total": round(month_stats["total"], 2),
+        "invalid": month_stats["invalid"],
+        "types": {key: round(hours, 2)
+                  for key, hours in sorted(month_stats["types"].items())},
+        "collaborators": {
+            key: round(hours, 2)
+            for key, hours in sorted(month_stats["collaborators"].items())},
+    }
+
+
+def build_reports():
+    """
+    Build every report from the record cache and the archive manifest.
+
+    @return
+        dict: (ETag, JSON body) pairs keyed by request path.
+    """
+    months = set(run.CACHE.stats)
+    if run.PARTITIONS is not None:
+        months.update(divmod(int(label.replace("-", "")), 100)
+                      for label in run.PARTITIONS.manifest())
+
+    reports = {}
+    summary = []
+    for year, month in sorted(months):
+        report = month_report(year, month)
+        if report is None:
+            continue
+        reports[f"/stats/{report['month']}"] = report
+        summary.append({key: report[key] for key in
+                        ("month", "archived", "tasks", "total", "invalid")})
+    reports["/stats"] = {
+        "months": summary,
+        "tasks": sum(entry["tasks"] for entry in summary),
+        "total": round(sum(entry["total"] for entry in summary), 2),
+    }
+
+    encoded = {}
+    for path, report in reports.items():
+        body = json.dumps(report).encode("utf-8")
+        etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        encoded[path] = (etag, body)
+    return encoded
+
+
+class ReportServer:
+    """
+    Serves the reports built from the shared record cache.
+
+    Args:
+        refresh: Seconds between two syncs of the record cache.
+    """
+
+    def __init__(self, refresh=REFRESH_SECONDS):
+        self.refresh = refresh
+        self.reports = {}
+        self.version = None
+
+    def update(self):
+        """
+        Sync the record cache and rebuild the reports if it or the archive
+        has changed.
+
+        Runs in a worker thread. Any failure, of the sync or of reading the
+        archive manifest (e.g. an API or credentials error), is reported and
+        the reports of the last successful refresh are kept, so the next
+        refresh tries again.
+
+        @return
+            None
+        """
+        try:
+            run.CACHE.sync()
+        except Exception as e:
+            print(f"Report refresh failed: {e!r}", file=sys.__stderr__)
+        try:
+            with run.CACHE.lock:
+                # The archive epoch is read by every sync and changes
+                # whenever the manifest does
+                version = (run.CACHE.generation, run.CACHE.epoch)
+                if version != self.version:
+                    self.reports = build_reports()
+                    self.version = version
+        except Exception as e:
+            print(f"Report refresh failed: {e!r}", file=sys.__stderr__)
+
+    async def refresh_forever(self):
+        """
+        Keep the reports up to date until cancelled.
+
+        @return
+            None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.update)
+            await asyncio.sleep(self.refresh)
+
+    def respond(self, method, path, headers):
+        """
+        Answer one request.
+
+        Args:
+            method: The request method.
+            path: The request path, without the query string.
+            headers: The request headers, with lower-case names.
+
+        @return
+            tuple: (status, headers, body). The body of a HEAD request is
+            returned too, for its length.
+        """
+        if method not in ("GET", "HEAD"):
+            return 405, {"Allow": "GET, HEAD"}, b""
+        report = self.reports.get(path.rstrip("/") or "/stats")
+        if report is None:
+            return 404, {"Content-Type": "application/json"}, \
+                b'{"error": "not found"}'
+        etag, body = report
+        response_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        match = headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in match.split(",")) \
+                or match.strip() == "*":
+            return 304, response_headers, b""
+        response_headers["Content-Type"] = "application/json"
+        return 200, response_headers, body
+
+    async def handle(self, reader, writer):
+        """
+        Serve the requests of one connection, keeping it alive between
+        requests unless the client asks to close it.
+
+        @return
+            None
+        """
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, version, headers = request
+                if method is None:
+                    status, response_headers, body = 400, {}, b""
+                else:
+                    status, response_headers, body = self.respond(
+                        method, path, headers)
+                connection = headers.get("connection", "").lower()
+                keep_alive = method is not None and (
+                    connection == "keep-alive" if version == "HTTP/1.0"
+                    else connection != "close")
+
+                response_headers["Date"] = formatdate(usegmt=True)
+                response_headers["Connection"] = \
+                    "keep-alive" if keep_alive else "close"
+                response_headers["Content-Length"] = len(body)
+                head = "".join(
+                    [f"HTTP/1.1 {status} {STATUS[status]}\r\n"]
+                    + [f"{name}: {value}\r\n"
+                       for name, value in response_headers.items()]
+                    + ["\r\n"])
+                writer.write(head.encode("latin-1")
+                             + (body if method != "HEAD" else b""))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):  # ValueError: line too long
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """
+        Read the request line and headers of the next request.
+
+        @return
+            tuple: (method, path, version, headers), with method None if
+            the request is malformed, or None when the connection is idle
+            or closed.
+        """
+        try:
+            line = await asyncio.wait_for(reader.readline(),
+                                          KEEP_ALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            return None
+        if not line.strip():
+            return None
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3:
+            return None, "", "HTTP/1.0", headers
+        method, target, version = parts
+        return method, target.partition("?")[0], version, headers
+
+
+async def serve_reports(host, port, refresh=REFRESH_SECONDS):
+    """
+    Serve the reports until cancelled.
+
+    The record cache (run.CACHE) must have been created by run.init or the
+    terminal worker; the first refresh loads it if needed.
+
+    Args:
+        host: The interface to listen on.
+        port: The TCP port to listen on.
+        refresh: Seconds between two syncs of the record cache.
+
+    @return
+        None
+    """
+    reports = ReportServer(refresh)
+    await asyncio.get_running_loop().run_in_executor(None, reports.update)
+    refresher = asyncio.create_task(reports.refresh_forever())
+    server = await asyncio.start_server(reports.handle, host, port,
+                                        backlog=1024)
+    print(f"Task Logger reports on http://{host}:{port}/stats",
+          file=sys.__stderr__)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refresher.cancel()
+
+
+def main():
+    """
+    Parse the command-line options, connect to the task log and serve the
+    reports.
+
+    @return
+        None
+    """
+    parser = argparse.ArgumentParser(description="Task Logger reports")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int,
+                        default=int(os.environ.get("REPORT_PORT", "8766")))
+    parser.add_argument("--refresh", type=float, default=REFRESH_SECONDS,
+                        help="seconds between two syncs of the task log")
+    args = parser.parse_args()
+    run.init()
+    try:
+        asyncio.run(serve_reports(args.host, args.port, args.refresh))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        run.save_snapshot()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,49 +7,382 @@ Google Sheets as the backend.
 
 Features:
 - Log tasks with details such as name, task description, date, hours, and type.
-- View logged tasks in a tabular format.
+- Offline-first logging: tasks are saved to a local journal at once and
+  replicated to Google Sheets in the background.
+- Bulk log several tasks at once with one batched upload.
+- View logged tasks in a paged tabular format, newest first.
 - Generate and display task statistics filtered by month.
+- Custom statistics over any date range, grouped by collaborator, task type,
+  day, week, month or year.
+- Archive closed months into monthly partitions to keep the live log small.
+- Data Quality Report of the tasks that fail validation, by row number.
 
 Usage:
 - Execute the script to start the interactive task logger program.
+- Pass a subcommand (log, logs, stats, query, export, archive, import,
+  check, replicate) to run a single action without prompts, e.g.
+  "python3 run.py stats --month 2024-05 --format json".
+- Add --profile to print the storage calls and action timings on exit.
 
 Author: Fabio Loche
 """
 from datetime import datetime
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from contextlib import nullcontext, redirect_stdout
+from functools import lru_cache
+import argparse
+import csv
 import json
 import os
+import sys
+import threading
 import calendar
-from prettytable import PrettyTable
 import gspread
-from google.oauth2.service_account import Credentials
+from client import get_client
+from records import (HEADERS, ISSUES, QUARANTINED, TASK_TYPES, RecordCache,
+                     describe_issues, pack_date, valid_hours)
+from query import DIMENSIONS, DateIndex, merge_results, run_query
+from storage import MultiStorage, SheetStorage, SQLiteStorage, copy_storage
+from task_queue import clear_queue, load_queue
+from journal import Journal, Replicator
+from profiling import Instrumented, Profiler
+from scheduler import Scheduled, Scheduler
+from tables import render_records, render_table
+from snapshot import read_snapshot, write_snapshot
+from importer import check_rows, read_rows, upload_rows
+from export import EXPORT_FORMATS, EXPORTERS, cache_chunks, export_rows, \
+    storage_chunks
+from archive import (LocalPartitions, SheetPartitions, archive_months,
+                     merge_entries, month_label)
 
 # Google Sheets Setup
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-# Decodes the environment variable
-CREDS_INFO = json.loads(os.environ["creds"])
 # Update with your Google Sheets ID
 SPREADSHEET_ID = "1jNF9dM8jqkJBCoWkHhPYtRDOtXTDtGt6Omdq5cZpX8U"
 SHEET_NAME = "Foglio1"  # Name of the sheet
+# Optional list of task logs to combine, e.g. one per team:
+# "SPREADSHEET_ID:WORKSHEET,SPREADSHEET_ID:WORKSHEET" (the worksheet name
+# defaults to SHEET_NAME). New tasks are logged to the first one.
+SHEETS = os.environ.get("SHEETS", "")
+# Task types accepted by validate_task: by name (any case) or menu number
+TYPE_CHOICES = {task_type.lower(): task_type for task_type in TASK_TYPES}
+TYPE_CHOICES.update(
+    (str(number), task_type) for number, task_type in enumerate(TASK_TYPES, 1))
+# Local journal holding logged tasks until they reach Google Sheets
+JOURNAL_FILE = "task_journal.jsonl"
+# Queue file of earlier versions, moved into the journal on startup
+QUEUE_FILE = "task_queue.jsonl"
+# Storage backend: "sheets" (Google Sheets) or "sqlite" (local file)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sheets")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "tasks.db")
+# Monthly partitions of archived tasks for the "sqlite" backend (the
+# "sheets" backend keeps them as worksheets of the spreadsheet)
+ARCHIVE_DIR = "archive"
+# Local copy of the record cache, restored on start to skip the full load
+SNAPSHOT_FILE = "tasks.snapshot"
+LOGS_PAGE_SIZE = 10  # Rows per page in View Logs (fits an 80x24 terminal)
+ISSUE_PREVIEW_ROWS = 10  # Flagged rows shown by the Data Quality Report
 
 # Global variables for Google Sheets integration
 CREDS = None
 CLIENT = None
 SHEET = None
+# Storage backend used by every menu action (wraps SHEET for Google Sheets)
+STORAGE = None
+# In-process copy of the sheet records, shared by all menu actions
+CACHE = None
+# Date-sorted index of the cached records for custom statistics
+DATE_INDEX = None
+# Task log the snapshot belongs to (None when it is not snapshotted) and
+# the cache generation it was saved or restored at
+SNAPSHOT_SOURCE = None
+SNAPSHOT_GENERATION = None
+# Monthly partitions of the archived tasks (None when not available), the
+# record caches of the ones read by queries and the archive epoch they
+# were read at
+PARTITIONS = None
+ARCHIVED_CACHES = {}
+ARCHIVED_EPOCH = None
+# Background connection state for the interactive menu
+CONNECTED = threading.Event()
+CONNECT_LOCK = threading.RLock()
+CONNECT_ERROR = None
+SETUP_MESSAGE = None
+SETUP_DONE = False
+# Write-ahead journal of logged tasks and the thread uploading it
+JOURNAL = None
+REPLICATOR = None
+# Call and action statistics, only collected when run with --profile
+PROFILER = None
+# Rate limits and coalesces the Sheets API calls of every session
+SCHEDULER = Scheduler()
+
+
+def parse_sheets(value):
+    """
+    Parse a list of task logs given as "SPREADSHEET_ID:WORKSHEET" pairs.
+
+    Args:
+        value: The comma separated pairs; the worksheet name may be left
+            out to use SHEET_NAME.
+
+    @return
+        list: (spreadsheet_id, worksheet_name) tuples, or the default sheet
+        if ``value`` is empty.
+    """
+    sheets = []
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        spreadsheet_id, _, worksheet = part.partition(":")
+        sheets.append((spreadsheet_id.strip(), worksheet.strip() or SHEET_NAME))
+    return sheets or [(SPREADSHEET_ID, SHEET_NAME)]
+
+
+def init(sheets=None):
+    """
+    Initialize the storage backend and set up global variables.
+    With the default "sheets" backend this function uses service account
+    credentials (decoded from the "creds" environment variable) to authorize
+    the Google Sheets client and opens the specified sheet for operations.
+    The client is shared by every caller in the process (see client.py):
+    its connections are kept alive and its access token is cached on disk
+    and reused until it expires. When several sheets are given (one per
+    team, say), they are opened in parallel and combined into one task log
+    whose reads fan out to every sheet at once; SHEET is then the first
+    one, which receives new tasks. Every worksheet call goes through
+    SCHEDULER, which keeps the process within the API quota.
+    With the "sqlite" backend it opens the local file at SQLITE_PATH instead,
+    so the program runs without any network access.
+    The record cache is created empty: the task log is downloaded the first
+    time records are needed, so actions that only append never read it.
+    If a snapshot of the same task log was saved by an earlier session, the
+    cache is restored from it instead and, unless rows were edited or
+    deleted since, only the rows appended since are downloaded.
+
+    Args:
+        sheets: (spreadsheet_id, worksheet_name) tuples, defaults to the
+            SHEETS setting.
+
+    @return
+        None
+    """
+    global CREDS, CLIENT, SHEET, STORAGE, CACHE, DATE_INDEX
+    global SNAPSHOT_SOURCE, SNAPSHOT_GENERATION, PARTITIONS
+    if STORAGE_BACKEND == "sqlite":
+        SNAPSHOT_SOURCE = f"sqlite:{os.path.abspath(SQLITE_PATH)}"
+        PARTITIONS = LocalPartitions(ARCHIVE_DIR)
+        STORAGE = SQLiteStorage(SQLITE_PATH)
+        if PROFILER:
+            STORAGE = Instrumented(STORAGE, PROFILER)
+    else:
+        creds_info = json.loads(os.environ["creds"])
+        CLIENT, CREDS = get_client(creds_info, SCOPES)
+        sheets = sheets or parse_sheets(SHEETS)
+        with ThreadPoolExecutor(max_workers=len(sheets)) as pool:
+            worksheets = list(pool.map(
+                lambda sheet: CLIENT.open_by_key(sheet[0]).worksheet(sheet[1]),
+                sheets))
+        def wrap(worksheet):
+            if PROFILER:
+                worksheet = Instrumented(worksheet, PROFILER)
+            return Scheduled(worksheet, SCHEDULER)
+
+        worksheets = [wrap(w) for w in worksheets]
+        SHEET = worksheets[0]
+        if len(worksheets) == 1:
+            SNAPSHOT_SOURCE = "sheets:{}:{}".format(*sheets[0])
+            # The spreadsheet is wrapped too: looking up the partitions
+            # is an API call like any worksheet call
+            PARTITIONS = SheetPartitions(wrap(SHEET.spreadsheet),
+                                         sheets[0][1], wrap)
+            STORAGE = SheetStorage(SHEET)
+        else:
+            SNAPSHOT_SOURCE = None
+            PARTITIONS = None
+            STORAGE = MultiStorage([SheetStorage(w) for w in worksheets])
+    CACHE = RecordCache(STORAGE, PARTITIONS.epoch if PARTITIONS else None)
+    DATE_INDEX = DateIndex(CACHE)
+    SNAPSHOT_GENERATION = None
+    if SNAPSHOT_SOURCE and read_snapshot(CACHE, SNAPSHOT_FILE, SNAPSHOT_SOURCE):
+        SNAPSHOT_GENERATION = CACHE.generation
+
+
+def save_snapshot():
+    """
+    Save the record cache for the next warm start, if it has changed.
+
+    Failing to write the snapshot is not an error: the next session simply
+    downloads the task log again. After this session appended to a Google
+    Sheet, the cells of the last row are read once more, so the next
+    session can check the snapshot against them.
+
+    @return
+        None
+    """
+    global SNAPSHOT_GENERATION
+    if (not SNAPSHOT_SOURCE or CACHE is None or not CACHE.loaded
+            or CACHE.generation == SNAPSHOT_GENERATION):
+        return
+    try:
+        if not CACHE.checkable():
+            CACHE.sync()
+    except Exception:
+        return
+    if not CACHE.checkable():
+        return
+    try:
+        if write_snapshot(CACHE, SNAPSHOT_FILE, SNAPSHOT_SOURCE):
+            SNAPSHOT_GENERATION = CACHE.generation
+    except OSError:
+        pass
+
+
+def open_journal():
+    """
+    Open the local task journal.
+
+    Tasks left in the queue file of earlier versions are moved into the
+    journal, so they are replicated like any other pending task.
+
+    @return
+        None
+    """
+    global JOURNAL
+    JOURNAL = Journal(JOURNAL_FILE)
+    queued = load_queue(QUEUE_FILE)
+    if queued:
+        JOURNAL.write_many(queued)
+        clear_queue(QUEUE_FILE)
+
+
+def start_replication():
+    """
+    Start the background thread uploading the journal to the task log.
+
+    Only one thread replicates the journal: if it is already running (the
+    worker connected again), it is pointed at the new record cache instead
+    of starting a second one that would upload the same tasks.
+
+    @return
+        None
+    """
+    global REPLICATOR
+    with CONNECT_LOCK:
+        if REPLICATOR is not None and REPLICATOR.is_alive():
+            REPLICATOR.cache = CACHE
+            return
+        REPLICATOR = Replicator(JOURNAL, CACHE)
+        REPLICATOR.start()
+
+
+def stop_replication(timeout=10.0):
+    """
+    Make a last attempt to upload the journal and stop replicating.
+
+    Args:
+        timeout: Seconds to wait for the upload.
+
+    @return
+        int: The number of tasks still waiting in the journal.
+    """
+    if REPLICATOR is None or not REPLICATOR.is_alive():
+        return pending_tasks()
+    return REPLICATOR.stop(timeout)
+
+
+def pending_tasks():
+    """
+    @return
+        int: The number of logged tasks not uploaded to the task log yet.
+    """
+    return len(JOURNAL) if JOURNAL is not None else 0
+
+
+def setup_connection():
+    """
+    Connect to the task log, check its headers and start replication.
 
+    @return
+        str: The message of the header check, or None if there is nothing
+        to report.
+    """
+    init()
+    message = check_headers()
+    start_replication()
+    return message
 
-def init():
+
+def connect_in_background():
     """
-    Initialize the Google Sheets connection and set up global variables.
-    This function uses service account credentials to authorize the
-    Google Sheets client and opens the specified sheet for operations.
+    Run setup_connection() in a background thread and warm up the record
+    cache.
+
+    The menu can be shown straight away while the credentials are decoded,
+    the client is authorized and the sheet is opened. Once connected, the
+    thread also loads the records so that the first View Logs or View
+    Statistics does not wait for them. Any error is kept in CONNECT_ERROR
+    and reported by wait_for_connection.
+
     @return
         None
     """
-    global CREDS, CLIENT, SHEET
-    CREDS = Credentials.from_service_account_info(CREDS_INFO, scopes=SCOPES)
-    CLIENT = gspread.authorize(CREDS)
-    SHEET = CLIENT.open_by_key(SPREADSHEET_ID).worksheet(SHEET_NAME)
+    def connect():
+        global CONNECT_ERROR, SETUP_MESSAGE
+        try:
+            SETUP_MESSAGE = setup_connection()
+        except Exception as e:
+            CONNECT_ERROR = e
+            return
+        finally:
+            CONNECTED.set()
+        try:
+            CACHE.sync()
+            save_snapshot()
+        except Exception:
+            # Not fatal: the records are loaded again on first use
+            pass
+
+    CONNECTED.clear()
+    threading.Thread(target=connect, daemon=True).start()
+
+
+def wait_for_connection():
+    """
+    Wait for the background connection before running a menu action.
+
+    The first time the connection is ready this also displays the result
+    of the header check. If connecting failed, the error is displayed and
+    a new attempt is started in the background.
+
+    Sessions of the terminal worker call this at the same time, so the
+    check and the new attempt are made under CONNECT_LOCK: one session
+    starts the attempt and the others are told to try again.
+
+    @return
+        bool: True if the storage is ready to use.
+    """
+    global CONNECT_ERROR, SETUP_DONE
+    if not CONNECTED.is_set():
+        print("Connecting to the task log...")
+    CONNECTED.wait()
+
+    with CONNECT_LOCK:
+        if not CONNECTED.is_set():
+            # Another session has just started a new attempt
+            print("Still connecting to the task log, please try again.")
+            return False
+        if CONNECT_ERROR is not None:
+            print(f"Could not connect to the task log: {CONNECT_ERROR}")
+            print("Retrying in the background, please try again.")
+            CONNECT_ERROR = None
+            connect_in_background()
+            return False
+
+        if not SETUP_DONE:
+            if SETUP_MESSAGE:
+                print(SETUP_MESSAGE)
+            SETUP_DONE = True
+    return True
 
 
 def welcome_message():
@@ -86,33 +419,44 @@ def get_current_datetime():
     return datetime.now().strftime("%d-%m-%Y %H:%M:%S")
 
 
-def ensure_headers():
+def check_headers():
     """
-    Ensure that the Google Sheet has the correct headers.
+    Ensure that the task log has the correct headers.
 
-    This function checks whether the first row of the Google Sheet contains
-    the expected headers. If the sheet is empty, it adds the headers. If the
-    headers are present but do not match the expected format, it displays
-    a warning.
+    This function reads only the first row of the task log and checks
+    whether it contains the expected headers. If the task log is empty, it adds
+    the headers. If the headers are present but do not match the expected
+    format, it returns a warning.
 
     Expected headers:
         ["Name", "Task", "Date", "Hours", "Type", "Recorded At"]
 
-    Args:
-        None
-
     @return
-        None
+        str: The message to display, or None if the headers are correct.
     """
     headers = ["Name", "Task", "Date", "Hours", "Type", "Recorded At"]
-    existing_data = SHEET.get_all_records()
+    existing_headers = STORAGE.header()
 
     # Check if headers are missing or don't match
-    if not existing_data:  # If the sheet is empty
-        SHEET.append_row(headers)
-        print("Headers added to Google Sheets.")
-    elif list(existing_data[0].keys()) != headers:  # If headers don't match
-        print("Warning: The headers in the sheet don't match expected format.")
+    if not existing_headers:  # If the sheet is empty
+        CACHE.set_headers(headers)
+        return "Headers added to the task log."
+    if existing_headers != headers:  # If headers don't match
+        return ("Warning: The headers in the task log don't match expected "
+                "format.")
+    return None
+
+
+def ensure_headers():
+    """
+    Check the headers of the task log and display the result.
+
+    @return
+        None
+    """
+    message = check_headers()
+    if message:
+        print(message)
 
 
 def get_date():
@@ -186,8 +530,10 @@ def log_task():
         - Task Type: Administrative, Marketing, or Product.
         - Recorded At: The current date and time of the task entry.
 
-    Validates user inputs before appending to Google Sheets. Displays an
-    error message if logging fails.
+    Validates user inputs and saves the task to the local journal, from
+    which it is uploaded to Google Sheets in the background, so logging
+    does not wait for the Sheets API. Displays an error message if the
+    task cannot be saved.
 
     @return
         None
@@ -207,40 +553,208 @@ def log_task():
 
     date = get_date()  # Function to get date (custom or current)
 
-    # Validate and ensure the hours input is a positive float
+    # Validate and ensure the hours input is a positive, finite float
     while True:
         hours_input = input("Enter hours worked: ").strip()
         try:
             hours = float(hours_input)
-            if hours > 0:
+            if valid_hours(hours):
                 break
-            print("Hours must be greater than 0.")
+            print("Hours must be a finite number greater than 0.")
         except ValueError:
             print("Invalid input for hours. Please enter a valid number.")
 
     task_type = select_task_type()  # Function to select the task type
     recorded_at = get_current_datetime()  # Get the current date and time
 
-    # Append data to the Google Sheet
+    # Save the task locally; it is replicated to the Google Sheet
     try:
-        SHEET.append_row([name, task, date, hours, task_type, recorded_at])
+        save_tasks([[name, task, date, hours, task_type, recorded_at]])
         print("Task logged successfully.")
-    except gspread.exceptions.APIError as e:
-        print("Failed to log task due to an API error:", e)
-    except gspread.exceptions.SpreadsheetNotFound:
-        print("Spreadsheet not found. Please check your spreadsheet ID.")
+    except OSError as e:
+        print("Failed to save task to the local journal:", e)
+
+
+@lru_cache(maxsize=4096)
+def normalize_date(value):
+    """
+    Check a DD-MM-YYYY date and return it zero-padded.
+
+    Imports repeat the same few hundred dates many times, so results are
+    memoized and each distinct string is parsed once.
+
+    Args:
+        value: The date string.
+
+    @return
+        str: The date in DD-MM-YYYY format, or None if it is invalid.
+    """
+    try:
+        return datetime.strptime(value, "%d-%m-%Y").strftime("%d-%m-%Y")
+    except ValueError:
+        return None
+
+
+def validate_task(name, task, date, hours, task_type):
+    """
+    Validate the fields of a task entered in one go.
+
+    Applies the same rules as the prompts in log_task and get_date:
+    name and task must not be empty, the date must be DD-MM-YYYY (empty
+    means today), hours must be a positive number and the type must be one
+    of the predefined task types, given by name or by its menu number.
+
+    Args:
+        name: The name of the person logging the task.
+        task: A description of the task performed.
+        date: The task date, or an empty string for today.
+        hours: The number of hours spent on the task.
+        task_type: The task type name or its number (1, 2 or 3).
+
+    @return
+        list: The validated row [name, task, date, hours, task_type].
+
+    Raises:
+        ValueError: With a message describing the first invalid field.
+    """
+    name = str(name).strip()
+    task = str(task).strip()
+    if not name:
+        raise ValueError("Name cannot be empty.")
+    if not task:
+        raise ValueError("Task description cannot be empty.")
+
+    date = str(date).strip()
+    if not date:
+        date = datetime.now().strftime("%d-%m-%Y")
+    else:
+        date = normalize_date(date)
+        if date is None:
+            raise ValueError("Invalid date format. Please use DD-MM-YYYY.")
+
+    try:
+        hours = float(hours)
     except ValueError as e:
-        print("Provided data is invalid:", e)
+        raise ValueError("Invalid input for hours. Please enter a valid "
+                         "number.") from e
+    if not valid_hours(hours):
+        raise ValueError("Hours must be a finite number greater than 0.")
+
+    task_type = TYPE_CHOICES.get(str(task_type).strip().lower())
+    if task_type is None:
+        raise ValueError(f"Task type must be one of {', '.join(TASK_TYPES)}.")
+
+    return [name, task, date, hours, task_type]
+
+
+def save_tasks(rows):
+    """
+    Durably save tasks to the local journal and wake up the replication.
+
+    Args:
+        rows: A list of rows, each one a list of cell values.
+
+    @return
+        None
+
+    Raises:
+        OSError: If the journal cannot be written.
+    """
+    JOURNAL.write_many(rows)
+    if REPLICATOR is not None:
+        REPLICATOR.notify()
+
+
+def upload_journal():
+    """
+    Upload the tasks waiting in the local journal in the foreground.
+
+    Used by the command line, which exits before a background replication
+    would get to them. Tasks that already reached the sheet (the program
+    stopped before recording it) are recognised and not uploaded twice. If
+    the upload fails the tasks stay in the journal and are retried later.
+
+    @return
+        bool: True if no task is left waiting.
+    """
+    if not len(JOURNAL):
+        return True
+    replicator = Replicator(JOURNAL, CACHE)
+    try:
+        replicator.reconcile()
+        uploaded = replicator.replicate_all()
+    except gspread.exceptions.APIError as e:
+        print(f"Failed to upload {len(JOURNAL)} pending task(s) due to an "
+              "API error:", e)
+        print("They are kept in the local journal and will be retried.")
+        return False
+    if uploaded:
+        print(f"{uploaded} pending task(s) uploaded to the task log.")
+    return True
+
+
+def bulk_log_tasks():
+    """
+    Log several tasks at once.
+
+    The user types or pastes one task per line as CSV:
+        Name,Task,Date,Hours,Type
+    The date may be left empty to use today's date and the type may be
+    given by name or by its number. An empty line ends the input. Invalid
+    lines are reported and skipped; valid tasks are saved to the local
+    journal and then uploaded in the background with one batched append.
+
+    @return
+        None
+    """
+    print("\nBulk Log Tasks:")
+    print("Enter one task per line as: Name,Task,Date,Hours,Type")
+    print("Leave Date empty for today. Type: 1/Administrative, "
+          "2/Marketing, 3/Product.")
+    print("Press Enter on an empty line to finish.")
+
+    rows = []
+    line_number = 0
+    while True:
+        line = input("> ").strip()
+        if not line:
+            break
+        line_number += 1
+        fields = next(csv.reader([line]))
+        if len(fields) != 5:
+            print(f"Line {line_number} skipped: expected 5 fields, "
+                  f"got {len(fields)}.")
+            continue
+        try:
+            row = validate_task(*fields)
+        except ValueError as e:
+            print(f"Line {line_number} skipped: {e}")
+            continue
+        rows.append(row + [get_current_datetime()])
+
+    if not rows:
+        print("No tasks to log.")
+        return
+
+    try:
+        save_tasks(rows)
+        print(f"{len(rows)} task(s) logged successfully.")
+    except OSError as e:
+        print("Failed to save tasks to the local journal:", e)
 
 
 def view_logs():
     """
-    Display all logged tasks in a tabular format in the terminal.
+    Display the logged tasks in the terminal, one page at a time.
 
-    This function retrieves all records from the Google Sheet and displays them
-    in a neatly formatted table using the PrettyTable library. If there are no
-    logs available, it informs the user. In case of any errors during the
-    process, an error message is displayed.
+    This function syncs the record cache and shows the logs in pages of
+    LOGS_PAGE_SIZE rows, newest first, each one rendered as a small table
+    (see tables.render_table). Only the rows of the current page are
+    rendered, so the first screen appears at once however large the sheet
+    is and every page fits the 80x24 web terminal. The user can move to the
+    next or previous page, jump to a page number or go back to the menu.
+    If there are no logs available, it informs the user. In case of any
+    errors during the process, an error message is displayed.
 
     @return
         None
@@ -248,16 +762,42 @@ def view_logs():
     try:
         print("\nView Logs in Terminal:")
 
-        records = SHEET.get_all_records()
+        records = CACHE.get_records()
+        pending = pending_tasks()
+        if pending:
+            print(f"{pending} task(s) logged here are still being uploaded "
+                  "to the task log.")
         if not records:
             print("No logs available to view.")
             return
 
-        table = PrettyTable()
-        table.field_names = records[0].keys()
-        for record in records:
-            table.add_row(record.values())
-        print(table)
+        page = 1
+        while True:
+            total_pages = CACHE.page_count(LOGS_PAGE_SIZE)
+            page = min(max(page, 1), total_pages)
+
+            render_table(CACHE.record_keys(),
+                         [list(record.values())
+                          for record in CACHE.page(page, LOGS_PAGE_SIZE)])
+            print(f"Page {page} of {total_pages} "
+                  f"({len(CACHE.records)} logs, newest first)")
+
+            command = input(
+                "[n]ext, [p]revious, page number to jump, [q]uit: "
+            ).strip().lower()
+            if command in ("", "n", "next"):
+                if page == total_pages:
+                    break
+                page += 1
+            elif command in ("p", "prev", "previous"):
+                page -= 1
+            elif command in ("q", "quit"):
+                break
+            elif command.isdigit() and 1 <= int(command) <= total_pages:
+                page = int(command)
+            else:
+                print(f"Invalid choice. Enter n, p, q or a page number "
+                      f"between 1 and {total_pages}.")
 
     except gspread.exceptions.APIError as e:
         print(f"Error viewing logs due to API error: {e}")
@@ -267,21 +807,13 @@ def view_logs():
         print(f"Invalid data: {e}")
 
 
-def filter_tasks_by_month(records):
+def select_month():
     """
-    Filter task records by the selected month.
-
-    This function provides the user with a list of the last 12 months to choose
-    from. It filters the task records based on the selected month and year.
-
-    Args:
-        records: A list of task records retrieved from the Google Sheet.
+    Let the user pick one of the last 12 months.
 
     @return
-        tuple: A tuple containing:
-            - filtered_records (list): Task records for the selected month.
-            - selected_month_name (str): The name of the selected month,
-            or None if no valid choice is made.
+        tuple: (month_name, month, year) for the selected month, or None if
+        no valid choice is made.
     """
     today = datetime.now()
 
@@ -301,141 +833,986 @@ def filter_tasks_by_month(records):
         choice = int(input("Enter the number corresponding to your choice: ")) - 1
         if choice < 0 or choice >= len(months):
             print("Invalid choice.")
-            return [], None
+            return None
     except ValueError:
         print("Invalid input. Please enter a number.")
-        return [], None
+        return None
+
+    return months[choice]
+
+
+def archived_month(year, month):
+    """
+    Look up a month in the archive manifest.
+
+    @return
+        dict: The manifest entry of the month, or None if it is not archived.
+    """
+    if PARTITIONS is None:
+        return None
+    return PARTITIONS.manifest().get(month_label(year * 100 + month))
+
+
+def archived_cache(key):
+    """
+    Load the records of an archived month from its partition only.
+
+    Partitions only change when months are archived, so the loaded cache
+    is kept until the archive epoch changes.
+
+    Args:
+        key: The YYYYMM month key.
+
+    @return
+        RecordCache: The records of the partition, or None if the month has
+        no partition.
+    """
+    global ARCHIVED_EPOCH
+    epoch = PARTITIONS.epoch()
+    if epoch != ARCHIVED_EPOCH:
+        ARCHIVED_CACHES.clear()
+        ARCHIVED_EPOCH = epoch
+    if key not in ARCHIVED_CACHES:
+        partition = PARTITIONS.open(key)
+        month_cache = None
+        if partition is not None:
+            month_cache = RecordCache(partition)
+            month_cache.load()
+        ARCHIVED_CACHES[key] = month_cache
+    return ARCHIVED_CACHES[key]
+
+
+def archived_keys(start=None, end=None):
+    """
+    List the archived months that overlap a date range.
+
+    Args:
+        start: The first packed YYYYMMDD date, or None for no bound.
+        end: The last packed YYYYMMDD date, or None for no bound.
+
+    @return
+        list: The YYYYMM keys of the archived months, in order.
+    """
+    if PARTITIONS is None:
+        return []
+    keys = sorted(int(label.replace("-", ""))
+                  for label in PARTITIONS.manifest())
+    return [key for key in keys
+            if (not start or key >= start // 100)
+            and (not end or key <= end // 100)]
+
+
+def query_tasks(start, end, group_by):
+    """
+    Run a custom statistics query over the live task log and the archived
+    months in range, each archived month read from its own partition.
+
+    @return
+        tuple: (rows, invalid), as returned by query.run_query.
+    """
+    results = [run_query(CACHE, DATE_INDEX, start, end, group_by)]
+    for key in archived_keys(start, end):
+        month_cache = archived_cache(key)
+        if month_cache is not None:
+            results.append(run_query(month_cache, DateIndex(month_cache),
+                                     start, end, group_by))
+    return merge_results(results)
+
+
+def month_statistics(year, month):
+    """
+    Return the aggregates of a month, whether it is archived or live.
+
+    The totals of an archived month come from the archive manifest, without
+    reading any row; tasks of that month logged after it was archived are
+    added from the record cache.
 
-    selected_month_name, selected_month, selected_year = months[choice]
-    filtered_records = [
-        record
-        for record in records
-        if datetime.strptime(record['Date'], "%d-%m-%Y").month == selected_month
-        and datetime.strptime(record['Date'], "%d-%m-%Y").year == selected_year
-    ]
+    The live aggregates are copied under the cache lock, so the caller can
+    go through them while the replication thread adds records to the same
+    month.
 
-    return filtered_records, selected_month_name
+    @return
+        dict: The month aggregates (see records.new_month_stats), or None
+        if no record is dated in that month.
+    """
+    with CACHE.lock:
+        live = CACHE.month_stats(year, month)
+        if live:
+            live = dict(live, types=dict(live["types"]),
+                        collaborators=dict(live["collaborators"]))
+        tasks = len(CACHE.months.get((year, month), ()))
+    archived = archived_month(year, month)
+    if not archived:
+        return live
+    if live:
+        archived = merge_entries(archived, {
+            "tasks": tasks,
+            "total": live["total"],
+            "invalid": live["invalid"],
+            "types": live["types"],
+            "collaborators": live["collaborators"],
+        })
+    return archived
 
 
 def display_statistics_table():
     """
     Display task statistics for the selected month.
 
-    This function retrieves all task records from the Google Sheet and filters
-    them by the selected month. It calculates:
+    This function syncs the record cache and reads the aggregates of the
+    selected month from its monthly aggregate index (or from the archive
+    manifest for an archived month):
         - Hours worked per task type.
         - Hours worked by each collaborator.
         - Total hours logged for the selected month.
 
-    The statistics are displayed in a tabular format using the
-    PrettyTable library. If no logs are found or no records match
+    The statistics are displayed in a tabular format (see
+    tables.render_table). If no logs are found or no records match
     the selected month, appropriate messages are displayed.
 
     @return
         None
     """
     try:
-        records = SHEET.get_all_records()
+        records = CACHE.get_records()
 
-        if not records:
+        if not records and not (PARTITIONS and PARTITIONS.manifest()):
             print("No logs found. Please log a task first.")
             return
 
         while True:
-            filtered_records, selected_month_name = filter_tasks_by_month(records)
+            selection = select_month()
 
-            if filtered_records:
+            if selection is None:
+                print("Invalid choice. Please select a valid month.")
+                continue
+            selected_month_name, selected_month, selected_year = selection
+            month_stats = month_statistics(selected_year, selected_month)
+            if month_stats:
                 print(f"\nRecords found for {selected_month_name}.\n")
                 break
-            if selected_month_name is None:
-                print("Invalid choice. Please select a valid month.")
-            else:
-                print(f"No records found for {selected_month_name}. "
-                    "Please select another month.")
-
-        # Initialize data containers for statistics
-        task_type_data = defaultdict(float)
-        collaborator_data = defaultdict(float)
-        selected_month_total_hours = 0
-
-        # Calculate statistics for the selected month
-        for record in filtered_records:
-            task_type_data[record["Type"]] += float(record["Hours"])
-            collaborator_data[record["Name"]] += float(record["Hours"])
-            selected_month_total_hours += float(record["Hours"])
+            print(f"No records found for {selected_month_name}. "
+                "Please select another month.")
 
         # Helper function to generate and display tables
         def generate_table(data, title, headers):
-            table = PrettyTable()
-            table.title = title
-            table.field_names = headers
-            for key, value in data.items():
-                table.add_row([key, f"{value:.2f}h"])
-            print(table)
+            render_table(headers, [[key, f"{value:.2f}h"]
+                                   for key, value in data.items()],
+                         title=title)
 
         # Generate and display tables
         generate_table(
-            task_type_data,
+            month_stats["types"],
             f"Hours per Task Type for {selected_month_name}",
             ["Task Type", "Hours"]
         )
         generate_table(
-            collaborator_data,
+            month_stats["collaborators"],
             f"Hours by Collaborator for {selected_month_name}",
             ["Collaborator", "Hours"]
         )
-        print(f"\nTotal Hours for {selected_month_name}: {selected_month_total_hours:.2f}h")
+        print(f"\nTotal Hours for {selected_month_name}: {month_stats['total']:.2f}h")
+        if month_stats["invalid"]:
+            print(f"Warning: {month_stats['invalid']} record(s) with invalid "
+                  "hours were left out of the statistics (see the Data "
+                  "Quality Report).")
 
     except (ValueError, TypeError) as e:
         print(f"Error displaying statistics: {e}")
+    except gspread.exceptions.APIError as e:
+        print(f"Error displaying statistics due to API error: {e}")
 
 
-def main():
+def parse_query_date(value):
     """
-    Main function to initialize the program and provide a menu-driven interface
-    for the Task Logger program.
+    Parse an optional DD-MM-YYYY range bound.
 
-    The function offers the following options:
-        1. Log Task: Allows the user to log a new task.
-        2. View Logs: Displays all logged tasks in a tabular format.
-        3. View Statistics: Displays task statistics for a selected month.
-        4. Exit: Exits the program.
+    Args:
+        value: The date string; empty means no bound.
+
+    @return
+        int: The packed YYYYMMDD date, or None for no bound.
+
+    Raises:
+        ValueError: If the date is not in DD-MM-YYYY format.
+    """
+    if not value.strip():
+        return None
+    packed = pack_date(value.strip())
+    if not packed:
+        raise ValueError("Invalid date format. Please use DD-MM-YYYY.")
+    return packed
+
+
+def parse_group_by(value):
+    """
+    Parse a comma separated list of grouping dimensions.
 
-    The program initializes the Google Sheets connection and continues to
-    display the menu until the user chooses to exit.
+    Dimensions may be given by name (case-insensitive) or by their number
+    in DIMENSIONS, starting at 1.
+
+    Args:
+        value: e.g. "name,type" or "1,4".
+
+    @return
+        list: The dimension names.
+
+    Raises:
+        ValueError: If a dimension is unknown.
+    """
+    group_by = []
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        if part.isdigit() and 1 <= int(part) <= len(DIMENSIONS):
+            group_by.append(DIMENSIONS[int(part) - 1])
+            continue
+        matches = [d for d in DIMENSIONS if d.lower() == part.lower()]
+        if not matches:
+            raise ValueError(
+                f"Unknown group '{part}'. Use {', '.join(DIMENSIONS)}.")
+        group_by.append(matches[0])
+    return group_by
+
+
+def display_custom_statistics():
+    """
+    Display hours over a custom date range with custom grouping.
+
+    Prompts for a start and end date (either may be left empty for no
+    bound) and for the groups to break the hours down by, e.g. collaborator
+    and task type, or week. The records in range are selected with a
+    binary search on the date-sorted index, so ranges spanning several
+    years do not rescan every record. Archived months in range are read
+    from their own partitions (see query_tasks).
 
     @return
         None
     """
-    # Initialize global variables and Google Sheets connection
-    init()
+    try:
+        CACHE.get_records()
 
-    # Call the function to display the introduction
-    welcome_message()
+        while True:
+            try:
+                start = parse_query_date(input(
+                    "Start date (DD-MM-YYYY) or Enter for the earliest: "))
+                end = parse_query_date(input(
+                    "End date (DD-MM-YYYY) or Enter for the latest: "))
+                break
+            except ValueError as e:
+                print(e)
+
+        print("\nGroup by (comma separated, e.g. 1,2):")
+        for idx, dimension in enumerate(DIMENSIONS, start=1):
+            print(f"{idx}. {dimension}")
+        while True:
+            try:
+                group_by = parse_group_by(input("Enter your choice: "))
+                if group_by:
+                    break
+                print("Please choose at least one group.")
+            except ValueError as e:
+                print(e)
+
+        rows, invalid = query_tasks(start, end, group_by)
+        if not rows:
+            print("No records found for the selected range.")
+            return
+
+        render_table(group_by + ["Tasks", "Hours"],
+                     [list(label) + [count, f"{hours:.2f}h"]
+                      for label, hours, count in rows],
+                     title=f"Hours by {' and '.join(group_by)}")
+        print(f"\nTotal Hours: {sum(row[1] for row in rows):.2f}h")
+        if invalid:
+            print(f"Warning: {invalid} record(s) with invalid hours were "
+                  "left out of the statistics.")
+
+    except gspread.exceptions.APIError as e:
+        print(f"Error displaying statistics due to API error: {e}")
+
+
+def issue_table_rows(issues):
+    """
+    Build the table rows of flagged records: row number, issues and cells.
+
+    Args:
+        issues: (row number, flags) pairs from RecordCache.issue_rows.
+
+    @return
+        list: One list of cell strings per flagged record.
+    """
+    return [[number, describe_issues(flags)]
+            + ["" if value is None else str(value)
+               for value in CACHE.row(number - 2)]
+            for number, flags in issues]
+
+
+def data_quality_report():
+    """
+    Show the records of the task log that fail validation.
+
+    Every record is checked against the rules of Log Task when it enters
+    the record cache, so the report needs no extra pass over the task log.
+    It shows how many records have each issue and the first
+    ISSUE_PREVIEW_ROWS flagged records with their row number in the sheet,
+    so they can be fixed there. Records with a malformed date or hours
+    that are not a positive number are left out of the statistics; the
+    other issues are only reported. The full list is printed by the
+    "check" command.
+
+    @return
+        None
+    """
+    try:
+        CACHE.get_records()
+        issues = CACHE.issue_rows()
+        if not issues:
+            print("\nNo data-quality issues found in the task log.")
+            return
+
+        counts = {flag: 0 for flag in ISSUES}
+        quarantined = 0
+        for _, flags in issues:
+            quarantined += bool(flags & QUARANTINED)
+            for flag in ISSUES:
+                if flags & flag:
+                    counts[flag] += 1
+        print()
+        render_table(["Issue", "Records"],
+                     [[ISSUES[flag], count]
+                      for flag, count in counts.items() if count],
+                     title="Data Quality Report")
+        print(f"{len(issues)} record(s) flagged, {quarantined} left out of "
+              "the statistics.")
+
+        render_table(["Row", "Issues"] + CACHE.record_keys(),
+                     issue_table_rows(issues[:ISSUE_PREVIEW_ROWS]))
+        if len(issues) > ISSUE_PREVIEW_ROWS:
+            print(f"First {ISSUE_PREVIEW_ROWS} of {len(issues)} shown. Run "
+                  "\"python3 run.py check\" for the full list.")
+
+    except gspread.exceptions.APIError as e:
+        print(f"Error checking the task log due to API error: {e}")
+
+
+def write_records(records, headers, output_format, output):
+    """
+    Write records to a file object as JSON or CSV.
+
+    Args:
+        records: A sequence of record dictionaries.
+        headers: The column names, used as the CSV header row.
+        output_format: "json" or "csv".
+        output: The file object to write to.
+
+    @return
+        None
+    """
+    if output_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(headers)
+        for record in records:
+            writer.writerow([record.get(header, "") for header in headers])
+    else:
+        json.dump(list(records), output, indent=2)
+        output.write("\n")
+
+
+def write_issues(issues, output_format, output):
+    """
+    Write the records flagged by the data-quality scan as JSON, CSV or a
+    table.
+
+    Args:
+        issues: (row number, flags) pairs from RecordCache.issue_rows.
+        output_format: "json", "csv" or "table".
+        output: The file object to write to.
+
+    @return
+        None
+    """
+    headers = ["Row", "Issues"] + CACHE.record_keys()
+    if output_format == "table":
+        render_table(headers, issue_table_rows(issues), output)
+    elif output_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(headers)
+        writer.writerows(issue_table_rows(issues))
+    else:
+        json.dump([
+            {"row": number,
+             "issues": [ISSUES[flag] for flag in ISSUES if flags & flag],
+             "quarantined": bool(flags & QUARANTINED),
+             "record": CACHE.record(number - 2)}
+            for number, flags in issues
+        ], output, indent=2)
+        output.write("\n")
+
+
+def write_month_stats(month, month_stats, output_format, output):
+    """
+    Write the aggregates of one month to a file object as JSON or CSV.
+
+    Args:
+        month: The month label in YYYY-MM format.
+        month_stats: The month aggregates from the record cache, or None.
+        output_format: "json" or "csv".
+        output: The file object to write to.
+
+    @return
+        None
+    """
+    month_stats = month_stats or {
+        "types": {}, "collaborators": {}, "total": 0.0, "invalid": 0
+    }
+    if output_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(["Month", "Group", "Key", "Hours"])
+        for task_type, hours in month_stats["types"].items():
+            writer.writerow([month, "Type", task_type, f"{hours:.2f}"])
+        for name, hours in month_stats["collaborators"].items():
+            writer.writerow([month, "Collaborator", name, f"{hours:.2f}"])
+        writer.writerow([month, "Total", "", f"{month_stats['total']:.2f}"])
+    else:
+        json.dump({
+            "month": month,
+            "types": dict(month_stats["types"]),
+            "collaborators": dict(month_stats["collaborators"]),
+            "total": month_stats["total"],
+            "invalid": month_stats["invalid"],
+        }, output, indent=2)
+        output.write("\n")
+
+
+def write_query_rows(group_by, rows, invalid, output_format, output):
+    """
+    Write the result of a custom statistics query as JSON, CSV or a table.
+
+    Args:
+        group_by: The grouping dimensions.
+        rows: The (group values, hours, task count) rows from run_query.
+        invalid: The number of records left out for invalid hours.
+        output_format: "json", "csv" or "table".
+        output: The file object to write to.
+
+    @return
+        None
+    """
+    if output_format == "table":
+        render_table(group_by + ["Tasks", "Hours"],
+                     [list(label) + [count, f"{hours:.2f}h"]
+                      for label, hours, count in rows],
+                     output)
+    elif output_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(group_by + ["Tasks", "Hours"])
+        for label, hours, count in rows:
+            writer.writerow(list(label) + [count, f"{hours:.2f}"])
+    else:
+        json.dump({
+            "group_by": group_by,
+            "rows": [
+                dict(zip(group_by, label), Tasks=count, Hours=hours)
+                for label, hours, count in rows
+            ],
+            "total": sum(row[1] for row in rows),
+            "invalid": invalid,
+        }, output, indent=2)
+        output.write("\n")
+
+
+def parse_month(value):
+    """
+    Parse a YYYY-MM command-line argument.
+
+    Args:
+        value: The argument string.
+
+    @return
+        tuple: (year, month).
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a valid month.
+    """
+    try:
+        parsed = datetime.strptime(value, "%Y-%m")
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(
+            f"invalid month '{value}', expected YYYY-MM") from e
+    return parsed.year, parsed.month
+
+
+def build_parser():
+    """
+    Build the command-line parser for the non-interactive subcommands.
+
+    @return
+        argparse.ArgumentParser: The configured parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Task Logger. Run without a command for the "
+                    "interactive menu."
+    )
+    parser.add_argument("--profile", action="store_true",
+                        help="time every storage call and action and print "
+                             "a summary on exit")
+    parser.add_argument("--profile-json", metavar="FILE",
+                        help="with --profile, also write the statistics "
+                             "to FILE as JSON")
+    commands = parser.add_subparsers(dest="command")
+
+    log_parser = commands.add_parser("log", help="log a single task")
+    log_parser.add_argument("--name", required=True)
+    log_parser.add_argument("--task", required=True)
+    log_parser.add_argument("--date", default="",
+                            help="DD-MM-YYYY, defaults to today")
+    log_parser.add_argument("--hours", required=True)
+    log_parser.add_argument("--type", required=True, dest="task_type",
+                            help="Administrative, Marketing, Product or 1-3")
+
+    logs_parser = commands.add_parser("logs", help="print logged tasks")
+    logs_parser.add_argument("--format", choices=["json", "csv", "table"],
+                             default="json")
+    logs_parser.add_argument("--limit", type=int,
+                             help="only the most recent LIMIT tasks")
+
+    stats_parser = commands.add_parser("stats", help="print month statistics")
+    stats_parser.add_argument("--month", required=True, type=parse_month,
+                              help="YYYY-MM")
+    stats_parser.add_argument("--format", choices=["json", "csv"],
+                              default="json")
+
+    query_parser = commands.add_parser(
+        "query", help="print hours over a date range, grouped")
+    query_parser.add_argument("--from", dest="start", default="",
+                              help="first date, DD-MM-YYYY")
+    query_parser.add_argument("--to", dest="end", default="",
+                              help="last date, DD-MM-YYYY")
+    query_parser.add_argument("--group-by", default="name",
+                              help="comma separated: " + ",".join(DIMENSIONS))
+    query_parser.add_argument("--format", choices=["json", "csv", "table"],
+                              default="json")
+
+    export_parser = commands.add_parser("export",
+                                        help="export every task to a file")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS,
+                               default="csv")
+    export_parser.add_argument("--output", default="-",
+                               help="output file, '-' for stdout")
+    export_parser.add_argument("--stats", metavar="FILE",
+                               help="month statistics file (default: next "
+                                    "to the output file, as .stats.json)")
+
+    import_parser = commands.add_parser(
+        "import", help="import tasks from a CSV or .xlsx file")
+    import_parser.add_argument("file", help="columns: Name, Task, Date, "
+                                            "Hours, Type[, Recorded At]")
+    import_parser.add_argument("--skip-invalid", action="store_true",
+                               help="import the valid rows even if some "
+                                    "rows are invalid")
+    import_parser.add_argument("--dry-run", action="store_true",
+                               help="only validate the file")
+    import_parser.add_argument("--skip-rows", type=int, default=0,
+                               metavar="N",
+                               help="skip the first N valid tasks, imported "
+                                    "by an interrupted run")
+
+    check_parser = commands.add_parser(
+        "check", help="list the tasks that fail validation, by row")
+    check_parser.add_argument("--format", choices=["json", "csv", "table"],
+                              default="json")
+
+    archive_parser = commands.add_parser(
+        "archive", help="move closed months to monthly partitions")
+    archive_parser.add_argument("--before", type=parse_month,
+                                help="YYYY-MM, the first month kept in the "
+                                     "live task log (default: this month)")
+
+    replicate_parser = commands.add_parser(
+        "replicate", help="copy the task log to a local replica")
+    replicate_parser.add_argument("--to", choices=["sqlite"], required=True,
+                                  dest="target")
+    replicate_parser.add_argument("--path", default=SQLITE_PATH,
+                                  help="replica file (default: SQLITE_PATH)")
+    return parser
+
+
+def run_command(args):
+    """
+    Run one non-interactive subcommand.
+
+    Reuses the validation of the interactive log (validate_task) and the
+    aggregates of the record cache, without prompts, the welcome banner or
+    table rendering. Status messages go to stderr so that stdout only holds
+    the machine-readable output.
+
+    Tasks waiting in the local journal are uploaded before the command
+    runs. A logged task is saved to the journal first, so it is kept even
+    when the task log cannot be reached.
+
+    Args:
+        args: The namespace returned by the parser of build_parser.
+
+    @return
+        int: The process exit status.
+    """
+    if args.command == "import":
+        if args.skip_rows < 0:
+            print("--skip-rows cannot be negative.", file=sys.stderr)
+            return 2
+        try:
+            valid, errors = check_rows(read_rows(args.file), validate_task)
+        except (OSError, ValueError) as e:
+            print(f"Cannot read {args.file}: {e}", file=sys.stderr)
+            return 2
+        for number, message in errors:
+            print(f"Line {number}: {message}", file=sys.stderr)
+        print(f"{valid} valid task(s), {len(errors)} invalid row(s).",
+              file=sys.stderr)
+        if args.dry_run or (errors and not args.skip_invalid):
+            if errors and not args.dry_run:
+                print("Nothing imported. Fix the rows above or use "
+                      "--skip-invalid.", file=sys.stderr)
+            return 2 if errors else 0
+
+    open_journal()
+    if args.command == "log":
+        try:
+            row = validate_task(args.name, args.task, args.date, args.hours,
+                                args.task_type)
+        except ValueError as e:
+            print(f"Invalid task: {e}", file=sys.stderr)
+            return 2
+        row.append(get_current_datetime())
+        try:
+            save_tasks([row])
+        except OSError as e:
+            print("Failed to save task to the local journal:", e,
+                  file=sys.stderr)
+            return 1
+        json.dump(dict(zip(HEADERS, row)), sys.stdout)
+        sys.stdout.write("\n")
+
+    try:
+        init()
+        with redirect_stdout(sys.stderr):
+            ensure_headers()
+            upload_journal()
+    except Exception as e:
+        if args.command != "log":
+            raise
+        # The task is safe in the journal and is uploaded by the next run
+        print(f"Could not connect to the task log: {e}", file=sys.stderr)
+        print("The task is kept in the local journal and will be uploaded "
+              "later.", file=sys.stderr)
+
+    if args.command == "logs":
+        records = CACHE.get_records()
+        if args.limit is not None:
+            records = records[-args.limit:] if args.limit > 0 else records[:0]
+        if args.format == "table":
+            render_records(CACHE, records.positions)
+        else:
+            write_records(records, CACHE.record_keys(), args.format,
+                          sys.stdout)
+    elif args.command == "stats":
+        CACHE.get_records()
+        year, month = args.month
+        write_month_stats(f"{year}-{month:02d}",
+                          month_statistics(year, month),
+                          args.format, sys.stdout)
+    elif args.command == "query":
+        try:
+            start = parse_query_date(args.start)
+            end = parse_query_date(args.end)
+            group_by = parse_group_by(args.group_by)
+        except ValueError as e:
+            print(f"Invalid query: {e}", file=sys.stderr)
+            return 2
+        CACHE.get_records()
+        rows, invalid = query_tasks(start, end, group_by)
+        write_query_rows(group_by, rows, invalid, args.format, sys.stdout)
+    elif args.command == "export":
+        return export_tasks(args)
+    elif args.command == "import":
+        imported = [args.skip_rows]
+
+        def progress(uploaded):
+            imported[0] = uploaded
+            print(f"{uploaded} of {valid} task(s) imported...",
+                  file=sys.stderr)
+        try:
+            upload_rows(read_rows(args.file), validate_task, CACHE.append_many,
+                        get_current_datetime(), progress, args.skip_rows)
+        except gspread.exceptions.APIError as e:
+            print("Import stopped due to an API error:", e, file=sys.stderr)
+            print(f"{imported[0]} of {valid} task(s) were imported. Run the "
+                  f"import again with --skip-rows {imported[0]} to import "
+                  "the rest without duplicating them.", file=sys.stderr)
+            return 1
+    elif args.command == "archive":
+        if PARTITIONS is None:
+            print("Archiving is not available for combined task logs.",
+                  file=sys.stderr)
+            return 2
+        today = datetime.now()
+        year, month = args.before or (today.year, today.month)
+        entries = archive_months(STORAGE, PARTITIONS, year * 100 + month)
+        CACHE.load()
+        json.dump(entries, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+        print(f"Archived {sum(e['tasks'] for e in entries.values())} task(s) "
+              f"from {len(entries)} month(s).", file=sys.stderr)
+    elif args.command == "replicate":
+        return replicate_tasks(args)
+    elif args.command == "check":
+        CACHE.get_records()
+        issues = CACHE.issue_rows()
+        write_issues(issues, args.format, sys.stdout)
+        print(f"{len(issues)} task(s) flagged.", file=sys.stderr)
+        save_snapshot()
+        return 1 if issues else 0
+    save_snapshot()
+    return 0
+
+
+def export_tasks(args):
+    """
+    Stream every task to the export file and its statistics alongside.
+
+    Rows are read and written in chunks: from the record cache when it is
+    already in memory (e.g. restored from a snapshot), otherwise straight
+    from the storage one range at a time, so the export never holds the
+    whole task log. The tasks of archived months come first, read from
+    their partitions the same way, so the export and its statistics cover
+    every task.
+
+    Args:
+        args: The namespace of the export subcommand.
+
+    @return
+        int: The process exit status.
+    """
+    if CACHE.loaded or isinstance(STORAGE, MultiStorage):
+        CACHE.sync()
+        chunks = cache_chunks(CACHE)
+        headers = CACHE.record_keys()
+    else:
+        chunks = storage_chunks(STORAGE)
+        headers = STORAGE.header()
+        headers = headers[:6] if len(headers) >= 6 else HEADERS
+    archived = archived_keys()
+    if archived:
+        partitions = (PARTITIONS.open(key) for key in archived)
+        chunks = chain(chain.from_iterable(
+            storage_chunks(partition) for partition in partitions
+            if partition is not None), chunks)
+        print(f"Including {len(archived)} archived month(s).",
+              file=sys.stderr)
+
+    binary = EXPORTERS[args.format].binary
+    if args.output == "-":
+        output = sys.stdout.buffer if binary else sys.stdout
+        context = nullcontext(output)
+    elif binary:
+        context = open(args.output, "wb")
+    else:
+        context = open(args.output, "w", newline="", encoding="utf-8")
+    with context as output:
+        count, statistics = export_rows(chunks, headers, args.format, output)
+
+    stats_path = args.stats
+    if not stats_path and args.output != "-":
+        stats_path = f"{os.path.splitext(args.output)[0]}.stats.json"
+    if stats_path:
+        with open(stats_path, "w", encoding="utf-8") as stats_file:
+            json.dump(statistics, stats_file, indent=2)
+            stats_file.write("\n")
+    if args.output != "-":
+        print(f"Exported {count} task(s) to {args.output}.", file=sys.stderr)
+    if stats_path:
+        print(f"Statistics written to {stats_path}.", file=sys.stderr)
+    save_snapshot()
+    return 0
+
+
+def replicate_tasks(args):
+    """
+    Copy the task log to a local SQLite replica.
+
+    The replica is built next to its path and renamed over it, so running
+    the command again replaces an older replica in one step and readers of
+    the old file are never left with a half-written one. The replica is
+    used by running the program with STORAGE_BACKEND=sqlite and
+    SQLITE_PATH set to its path.
+
+    Args:
+        args: The namespace of the replicate subcommand.
+
+    @return
+        int: The process exit status.
+    """
+    path = os.path.abspath(args.path)
+    if STORAGE_BACKEND == "sqlite" and path == os.path.abspath(SQLITE_PATH):
+        print("The replica cannot replace the task log it is copied from.",
+              file=sys.stderr)
+        return 2
+    temporary = f"{path}.tmp"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    replica = SQLiteStorage(temporary)
+    try:
+        count = copy_storage(STORAGE, replica)
+    finally:
+        replica.close()
+    os.replace(temporary, path)
+    print(f"Copied {count} task(s) to {args.path}. Run with "
+          f"STORAGE_BACKEND=sqlite SQLITE_PATH={args.path} to use it.",
+          file=sys.stderr)
+    return 0
+
+
+def timed_action(name):
+    """
+    Time a top-level action when profiling is enabled.
+
+    Args:
+        name: The action name shown in the profile summary.
+
+    @return
+        A context manager timing the action, or doing nothing when
+        profiling is disabled.
+    """
+    return PROFILER.action(name) if PROFILER else nullcontext()
 
-    # Call ensure_headers to make sure headers are in place
-    ensure_headers()
 
+def report_profile(json_path=None, output=None):
+    """
+    Print the profile summary and optionally write it as JSON.
+
+    Args:
+        json_path: The JSON file to write, or None.
+        output: The file object to print to, defaults to stdout.
+
+    @return
+        None
+    """
+    print(PROFILER.summary(), file=output or sys.stdout)
+    if SCHEDULER.stats["calls"]:
+        stats = SCHEDULER.stats
+        print(f"Scheduler: {stats['calls']} API call(s), {stats['coalesced']} "
+              f"read(s) coalesced, {stats['waited']:.1f}s waiting for quota, "
+              f"{stats['throttled']} throttled.", file=output or sys.stdout)
+    if json_path:
+        PROFILER.dump(json_path)
+        print(f"Profile written to {json_path}.", file=output or sys.stdout)
+
+
+def menu():
+    """
+    Display the menu and run the chosen actions until the user exits.
+
+    The function offers the following options:
+        1. Log Task: Allows the user to log a new task.
+        2. View Logs: Displays logged tasks in pages, newest first.
+        3. View Statistics: Displays task statistics for a selected month.
+        4. Bulk Log Tasks: Logs several tasks with one batched upload.
+        5. Custom Statistics: Hours over any date range, grouped.
+        6. Data Quality Report: Tasks that fail validation, by row.
+        7. Exit: Exits the program.
+    When profiling is enabled, "P" prints the profile summary so far.
+    Logging only writes to the local journal, so options 1 and 4 never wait
+    for the connection to the task log.
+
+    @return
+        None
+    """
+    # Name, function and whether the action reads the task log
+    actions = {
+        '1': ("Log Task", log_task, False),
+        '2': ("View Logs", view_logs, True),
+        '3': ("View Statistics", display_statistics_table, True),
+        '4': ("Bulk Log Tasks", bulk_log_tasks, False),
+        '5': ("Custom Statistics", display_custom_statistics, True),
+        '6': ("Data Quality Report", data_quality_report, True),
+    }
     while True:
         print("\nOptions:")
         print("1. Log Task")
         print("2. View Logs")
         print("3. View Statistics")
-        print("4. Exit")
+        print("4. Bulk Log Tasks")
+        print("5. Custom Statistics")
+        print("6. Data Quality Report")
+        print("7. Exit")
+
+        if PROFILER:
+            print("P. Profile Summary")
 
         choice = input("Choose an option: ")
-        if choice == '1':
-            log_task()
-        elif choice == '2':
-            view_logs()
-        elif choice == '3':
-            display_statistics_table()
-        elif choice == '4':
+        if choice in actions:
+            name, action, reads = actions[choice]
+            with timed_action(name):
+                if not reads or wait_for_connection():
+                    action()
+        elif choice.lower() == 'p' and PROFILER:
+            print(PROFILER.summary())
+        elif choice == '7':
             print("Exiting program.")
             break
         else:
             print("Invalid choice. Please try again.")
 
 
+def main(argv=None):
+    """
+    Main function to initialize the program and provide a menu-driven interface
+    for the Task Logger program.
+
+    When a subcommand is given on the command line it is run by run_command
+    instead, and the program exits with its status.
+
+    The program connects to Google Sheets in the background, so the menu is
+    displayed straight away, and continues to display the menu until the
+    user chooses to exit. Logged tasks still waiting in the local journal
+    get a last upload attempt on exit.
+
+    Args:
+        argv: The command-line arguments, defaults to sys.argv[1:].
+
+    @return
+        None
+    """
+    global PROFILER
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        PROFILER = Profiler()
+
+    if args.command:
+        with timed_action(args.command):
+            status = run_command(args)
+        if PROFILER:
+            report_profile(args.profile_json, sys.stderr)
+        sys.exit(status)
+
+    # Open the local journal, then connect to Google Sheets in the
+    # background so the menu shows at once
+    open_journal()
+    connect_in_background()
+
+    # Call the function to display the introduction
+    welcome_message()
+
+    try:
+        menu()
+    finally:
+        pending = stop_replication()
+        if pending:
+            print(f"{pending} task(s) could not be uploaded yet. They are "
+                  "kept in the local journal and will be uploaded next time.")
+        save_snapshot()
+        if PROFILER:
+            report_profile(args.profile_json)
+
+
 if __name__ == "__main__":
     main()
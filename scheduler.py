@@ -0,0 +1,215 @@
+"""
+scheduler.py
+
+This module is part of the Task Logger program. It puts every Sheets API
+request of the process through one scheduler, so that several sessions
+reading and writing at once stay within the per-minute quota instead of
+failing with 429 errors.
+
+Features:
+- Single-flight reads: identical reads issued while one is already in
+  flight wait for it and share its result instead of calling the API.
+- A token bucket sized to the API quota: requests wait for a token rather
+  than being rejected by the API.
+- Writes go before reads waiting for a token, so logged tasks are never
+  held up by a burst of reads.
+- A 429 answer empties the bucket, so the requests behind it wait for the
+  quota to refill instead of failing in turn.
+"""
+from itertools import count
+import heapq
+import os
+import threading
+import time
+import gspread
+
+# The Sheets API allows 60 requests per minute per user; the bucket refills
+# at REQUESTS_PER_MINUTE and holds BURST tokens, which together stay within
+# the quota over any one-minute window
+REQUESTS_PER_MINUTE = int(os.environ.get("SHEETS_QUOTA", "50"))
+BURST = 10
+
+# Worksheet methods that only read; every other method is a write
+READ_METHODS = {"get", "get_all_values", "get_all_records", "get_values",
+                "batch_get", "row_values", "col_values", "acell", "cell",
+                "worksheet"}
+
+WRITE, READ = 0, 1
+
+
+class Flight:
+    """
+    A read in progress, whose result is shared by every caller waiting for
+    it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Scheduler:
+    """
+    Rate limits, prioritizes and coalesces the calls of one process.
+
+    Callers run their own calls in their own threads: the scheduler only
+    decides when each call may start, so it needs no thread of its own.
+
+    ``stats`` counts the calls made (``calls``), the reads served by
+    another caller's flight (``coalesced``), the seconds spent waiting for
+    a token (``waited``) and the 429 answers received (``throttled``).
+
+    Args:
+        per_minute: The number of requests allowed per minute.
+        burst: The number of requests that may be made at once after an
+            idle period.
+    """
+
+    def __init__(self, per_minute=REQUESTS_PER_MINUTE, burst=BURST):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.waiting = []  # Heap of (priority, ticket)
+        self.tickets = count()
+        self.flights = {}
+        self.stats = {"calls": 0, "coalesced": 0, "waited": 0.0,
+                      "throttled": 0}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _acquire(self, priority):
+        """
+        Wait for a token, behind every caller of a higher priority and
+        every earlier caller of the same priority.
+
+        Called with ``condition`` held.
+
+        @return
+            None
+        """
+        entry = (priority, next(self.tickets))
+        heapq.heappush(self.waiting, entry)
+        started = time.monotonic()
+        while True:
+            self._refill()
+            if self.waiting[0] == entry and self.tokens >= 1:
+                break
+            timeout = None
+            if self.waiting[0] == entry:
+                timeout = (1 - self.tokens) / self.rate
+            self.condition.wait(timeout)
+        heapq.heappop(self.waiting)
+        self.tokens -= 1
+        self.stats["calls"] += 1
+        self.stats["waited"] += time.monotonic() - started
+        self.condition.notify_all()
+
+    def _call(self, func, args, kwargs):
+        try:
+            return func(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status == 429:
+                with self.condition:
+                    self.stats["throttled"] += 1
+                    self.tokens = 0.0
+                    self.updated = time.monotonic()
+            raise
+
+    def write(self, func, *args, **kwargs):
+        """
+        Make a write call as soon as a token is free, before any read.
+
+        Reads already in flight can no longer be joined, so no read issued
+        after the write is answered with data from before it.
+
+        @return
+            The value returned by ``func``.
+        """
+        with self.condition:
+            self.flights.clear()
+            self._acquire(WRITE)
+        return self._call(func, args, kwargs)
+
+    def read(self, key, func, *args, **kwargs):
+        """
+        Make a read call, or wait for the identical call already in flight.
+
+        Callers sharing a flight share its result too, and must not modify
+        it.
+
+        Args:
+            key: Identifies the read: calls with the same key return the
+                same data.
+            func: The read to call.
+
+        @return
+            The value returned by ``func``.
+        """
+        with self.condition:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            with self.condition:
+                self._acquire(READ)
+            flight.result = self._call(func, args, kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.condition:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+            flight.done.set()
+
+
+class Scheduled:
+    """
+    Proxy that sends every method call of a worksheet through a Scheduler.
+
+    Reads (READ_METHODS) are coalesced per worksheet and arguments; other
+    methods are writes. Attribute reads other than methods are passed
+    through unchanged, so the proxy can stand in for a gspread Worksheet.
+
+    Args:
+        target: The worksheet.
+        scheduler: The Scheduler shared by every worksheet of the process.
+    """
+
+    def __init__(self, target, scheduler):
+        self._target = target
+        self._scheduler = scheduler
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        if name not in READ_METHODS:
+            return lambda *args, **kwargs: self._scheduler.write(
+                attribute, *args, **kwargs)
+
+        def read(*args, **kwargs):
+            key = (id(self._target), name, repr(args),
+                   repr(sorted(kwargs.items())))
+            return self._scheduler.read(key, attribute, *args, **kwargs)
+
+        return read
@@ -0,0 +1,257 @@
+"""
+server.py
+
+This script is part of the Task Logger program. It runs a long-lived worker
+that serves many web terminal sessions from a single Python process.
+
+The web terminal (controllers/default.js) normally spawns a new
+"python3 run.py" for every browser connection, so every visitor pays for
+interpreter startup, imports, Google Sheets authorization and a private copy
+of the records. When WORKER_PORT is set, it connects each browser session to
+this worker over TCP instead. The worker authorizes once, keeps the record
+cache warm and runs the usual menu of run.py for every session in its own
+thread, so all sessions share one connection and one dataset.
+With --report-port (or REPORT_PORT) it also serves the statistics as JSON
+for dashboards (see report_server.py), from the same record cache.
+
+Usage:
+- python3 server.py [--host HOST] [--port PORT] [--report-port PORT]
+"""
+import argparse
+import asyncio
+import codecs
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+import run
+import report_server
+
+# Terminal session of the current thread, used to route stdin/stdout
+SESSION = threading.local()
+
+# Seconds between two attempts to connect to the task log
+RETRY_SECONDS = 5.0
+
+# Control characters handled by the line discipline
+BACKSPACE = ("\x7f", "\x08")
+END_OF_SESSION = ("\x03", "\x04")  # Ctrl-C, Ctrl-D
+
+
+class Terminal:
+    """
+    Minimal line discipline over a socket, standing in for the pty.
+
+    Input is echoed back as it is typed, backspace erases the last
+    character, escape sequences (arrow keys and the like) are ignored and
+    Enter completes the line. Output newlines are translated to CRLF for
+    the browser terminal.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self.pending = ""
+        self.position = 0
+        self.skip_newline = False
+
+    def write(self, text):
+        """
+        Send text to the browser terminal.
+
+        @return
+            int: The number of characters written.
+        """
+        self.sock.sendall(text.replace("\n", "\r\n").encode("utf-8"))
+        return len(text)
+
+    def flush(self):
+        """
+        Nothing to flush: write() sends straight away.
+        """
+
+    def _next_char(self):
+        """
+        Return the next input character, waiting for the client if needed.
+
+        @return
+            str: One character, or an empty string if the client is gone.
+        """
+        while self.position >= len(self.pending):
+            data = self.sock.recv(4096)
+            if not data:
+                return ""
+            self.pending = self.decoder.decode(data)
+            self.position = 0
+        char = self.pending[self.position]
+        self.position += 1
+        return char
+
+    def readline(self, *_):
+        """
+        Read one line typed (or pasted) in the browser terminal.
+
+        @return
+            str: The line with a trailing newline, or an empty string when
+            the session ends (client closed, Ctrl-C or Ctrl-D).
+        """
+        line = []
+        while True:
+            char = self._next_char()
+            if not char or char in END_OF_SESSION:
+                return ""
+            if char == "\n" and self.skip_newline:
+                # Second half of a CRLF pair
+                self.skip_newline = False
+                continue
+            self.skip_newline = char == "\r"
+            if char in ("\r", "\n"):
+                self.write("\n")
+                return "".join(line) + "\n"
+            if char in BACKSPACE:
+                if line:
+                    line.pop()
+                    self.write("\b \b")
+            elif char == "\x1b":
+                self._skip_escape_sequence()
+            elif char.isprintable():
+                line.append(char)
+                self.write(char)
+
+    def _skip_escape_sequence(self):
+        """
+        Drop the rest of an escape sequence such as an arrow key.
+
+        @return
+            None
+        """
+        if self._next_char() != "[":
+            return
+        while True:
+            char = self._next_char()
+            if not char or char.isalpha() or char == "~":
+                return
+
+
+class RoutedStream:
+    """
+    Stand-in for sys.stdin/sys.stdout that forwards to the terminal of the
+    session running in the current thread, or to the real stream otherwise.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def _target(self):
+        return getattr(SESSION, "terminal", None) or self.fallback
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    def readline(self, *args):
+        return self._target().readline(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+class SessionHandler(socketserver.BaseRequestHandler):
+    """
+    Run the interactive menu of run.py for one browser session.
+    """
+
+    def handle(self):
+        SESSION.terminal = Terminal(self.request)
+        try:
+            run.welcome_message()
+            run.menu()
+        except (EOFError, OSError):
+            pass  # The browser went away
+        except Exception:
+            traceback.print_exc(file=sys.__stderr__)
+        finally:
+            SESSION.terminal = None
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded TCP server: one thread per terminal session.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def warm_up(host, report_port=None):
+    """
+    Wait for the worker to connect to the task log, retrying until it
+    succeeds, then serve the statistics reports from the shared record
+    cache if asked to.
+
+    Runs in a background thread, so sessions are accepted in the meantime.
+
+    @return
+        None
+    """
+    while not run.wait_for_connection():
+        time.sleep(RETRY_SECONDS)
+    if report_port:
+        asyncio.run(report_server.serve_reports(host, report_port))
+
+
+def serve(host, port, report_port=None):
+    """
+    Start the worker and serve terminal sessions until interrupted.
+
+    Args:
+        host: The interface to listen on.
+        port: The TCP port to listen on.
+        report_port: The TCP port of the statistics reports, or None not to
+            serve them.
+
+    @return
+        None
+    """
+    sys.stdin = RoutedStream(sys.stdin)
+    sys.stdout = RoutedStream(sys.stdout)
+    with WorkerServer((host, port), SessionHandler) as server:
+        # The socket is bound before connecting, so browsers opened while
+        # the worker authorizes and loads the records get a session at
+        # once; its actions that read the task log wait for the connection
+        run.open_journal()
+        run.connect_in_background()
+        threading.Thread(target=warm_up, args=(host, report_port),
+                         daemon=True).start()
+        print(f"Task Logger worker listening on {host}:{port}",
+              file=sys.__stderr__)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def main():
+    """
+    Parse the command-line options and start the worker.
+
+    @return
+        None
+    """
+    parser = argparse.ArgumentParser(description="Task Logger worker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int,
+                        default=int(os.environ.get("WORKER_PORT", "8765")))
+    parser.add_argument("--report-port", type=int,
+                        default=int(os.environ.get("REPORT_PORT", "0")),
+                        help="also serve the statistics as JSON on this port")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.report_port)
+
+
+if __name__ == "__main__":
+    main()
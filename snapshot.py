@@ -0,0 +1,231 @@
+"""
+snapshot.py
+
+This module is part of the Task Logger program. It saves the columns of the
+record cache to a compact local binary file and maps them back in on the
+next start, so a session does not download and parse the whole task log
+before it can show anything: the cache is restored from disk and only the
+rows appended since the snapshot are fetched (see RecordCache.sync). The
+snapshot carries what the cache checks the storage against: its revision
+(SQLite), or the cells of the last row (Google Sheets, where appends
+change the revision), and the archive epoch. If the task log has been
+edited since, it is loaded again instead.
+
+File layout:
+- MAGIC, then the length of the metadata as a 4-byte little-endian integer.
+- The metadata as JSON: format version, source tag, row count, headers,
+  last row, storage revision, last row cells, archive epoch, string
+  tables, data-quality issues, month index and month aggregates, and the
+  offset and length of every column section.
+- The column sections: the integer and float arrays in machine byte order
+  (names, types, dates, hours, month positions) and the text columns
+  (tasks, recorded) as NUL-separated UTF-8.
+The file is read through mmap, so every array is a single copy out of the
+page cache.
+"""
+from array import array
+import json
+import mmap
+import os
+import struct
+import sys
+from records import new_month_stats
+
+MAGIC = b"TLSNAP01"
+VERSION = 4
+ARRAY_COLUMNS = (("names", "I"), ("types", "I"), ("dates", "I"),
+                 ("hours", "d"))
+TEXT_COLUMNS = ("tasks", "recorded")
+SEPARATOR = "\x00"
+
+
+def layout():
+    """
+    Describe the machine layout the arrays are written in.
+
+    @return
+        dict: The byte order and the item sizes of the array types.
+    """
+    return {
+        "byteorder": sys.byteorder,
+        "itemsizes": {code: array(code).itemsize for code in "Id"},
+    }
+
+
+def write_snapshot(cache, path, source):
+    """
+    Save the columns and indexes of a loaded cache to a snapshot file.
+
+    The file is written next to ``path`` and renamed over it, so a crash
+    never leaves a half-written snapshot behind.
+
+    Args:
+        cache: The loaded RecordCache.
+        path: The snapshot file path.
+        source: A tag identifying the task log, e.g. its spreadsheet id;
+            a snapshot is only restored for the same source.
+
+    @return
+        bool: True if the snapshot was written, False if the cache holds
+        text that cannot be stored (a NUL character).
+    """
+    with cache.lock:
+        texts = {name: SEPARATOR.join(getattr(cache, name))
+                 for name in TEXT_COLUMNS}
+        if any(text.count(SEPARATOR) != max(len(cache) - 1, 0)
+               for text in texts.values()):
+            return False
+
+        month_keys = sorted(cache.months)
+        sections = [(name, getattr(cache, name).tobytes())
+                    for name, _ in ARRAY_COLUMNS]
+        month_positions = array("I")
+        for key in month_keys:
+            month_positions.extend(cache.months[key])
+        sections.append(("months", month_positions.tobytes()))
+        sections += [(name, text.encode("utf-8"))
+                     for name, text in texts.items()]
+
+        offsets = {}
+        offset = 0
+        for name, data in sections:
+            offsets[name] = [offset, len(data)]
+            offset += len(data)
+
+        meta = {
+            "version": VERSION,
+            "layout": layout(),
+            "source": source,
+            "count": len(cache),
+            "last_row": cache.last_row,
+            "revision": cache.revision,
+            "tail": cache.tail,
+            "epoch": cache.epoch,
+            "headers": cache.headers,
+            "name_table": cache.name_table.values,
+            "type_table": cache.type_table.values,
+            "raw_cells": [[position, column, text] for (position, column), text
+                          in cache.raw_cells.items()],
+            "issues": sorted(cache.issues.items()),
+            "months": [[year, month, len(cache.months[(year, month)])]
+                       for year, month in month_keys],
+            "stats": [[year, month, dict(stats["types"]),
+                       dict(stats["collaborators"]), stats["total"],
+                       stats["invalid"]]
+                      for (year, month), stats in cache.stats.items()],
+            "sections": offsets,
+        }
+
+    encoded = json.dumps(meta).encode("utf-8")
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as snapshot_file:
+        snapshot_file.write(MAGIC)
+        snapshot_file.write(struct.pack("<I", len(encoded)))
+        snapshot_file.write(encoded)
+        for _, data in sections:
+            snapshot_file.write(data)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temporary, path)
+    return True
+
+
+def read_snapshot(cache, path, source):
+    """
+    Restore a cache from a snapshot file.
+
+    The restored cache is marked as unverified: its next sync checks the
+    storage against the snapshot (revision or last row, and archive epoch)
+    before fetching the new rows.
+
+    Args:
+        cache: The RecordCache to fill.
+        path: The snapshot file path.
+        source: The tag of the task log the cache reads from.
+
+    @return
+        bool: True if the cache was restored, False if there is no usable
+        snapshot (missing, corrupt, another source or another machine
+        layout).
+    """
+    try:
+        with open(path, "rb") as snapshot_file, \
+                mmap.mmap(snapshot_file.fileno(), 0,
+                          access=mmap.ACCESS_READ) as mapped:
+            return _restore(cache, mapped, source)
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return False
+
+
+def _restore(cache, mapped, source):
+    """
+    Fill the cache from the mapped snapshot file.
+
+    @return
+        bool: True if the cache was restored.
+    """
+    if mapped[:len(MAGIC)] != MAGIC:
+        return False
+    start = len(MAGIC) + 4
+    (meta_length,) = struct.unpack("<I", mapped[len(MAGIC):start])
+    meta = json.loads(mapped[start:start + meta_length].decode("utf-8"))
+    if (meta["version"] != VERSION or meta["layout"] != layout()
+            or meta["source"] != source):
+        return False
+    base = start + meta_length
+    count = meta["count"]
+
+    view = memoryview(mapped)
+    try:
+        def section(name):
+            offset, length = meta["sections"][name]
+            return view[base + offset:base + offset + length]
+
+        columns = {}
+        for name, code in ARRAY_COLUMNS + (("months", "I"),):
+            columns[name] = array(code)
+            columns[name].frombytes(section(name))
+        texts = {name: str(section(name), "utf-8") for name in TEXT_COLUMNS}
+    finally:
+        view.release()
+
+    for name, _ in ARRAY_COLUMNS:
+        if len(columns[name]) != count:
+            raise ValueError(f"Snapshot column {name} is truncated")
+    texts = {name: text.split(SEPARATOR) if count else []
+             for name, text in texts.items()}
+
+    with cache.lock:
+        cache._reset()
+        for name, _ in ARRAY_COLUMNS:
+            setattr(cache, name, columns[name])
+        cache.tasks = texts["tasks"]
+        cache.recorded = texts["recorded"]
+        for table, values in ((cache.name_table, meta["name_table"]),
+                              (cache.type_table, meta["type_table"])):
+            table.values = values
+            table.codes = {value: code for code, value in enumerate(values)}
+        cache.raw_cells = {(position, column): text
+                           for position, column, text in meta["raw_cells"]}
+        cache.issues = dict(map(tuple, meta["issues"]))
+
+        offset = 0
+        for year, month, length in meta["months"]:
+            cache.months[(year, month)] = columns["months"][offset:offset + length]
+            offset += length
+        for year, month, types, collaborators, total, invalid in meta["stats"]:
+            month_stats = new_month_stats()
+            month_stats["types"].update(types)
+            month_stats["collaborators"].update(collaborators)
+            month_stats["total"] = total
+            month_stats["invalid"] = invalid
+            cache.stats[(year, month)] = month_stats
+
+        cache.headers = meta["headers"]
+        cache.last_row = meta["last_row"]
+        cache.revision = meta["revision"]
+        cache.tail = meta["tail"]
+        cache.epoch = meta["epoch"]
+        cache.loaded = True
+        cache.verified = False
+    return True
@@ -0,0 +1,538 @@
+"""
+storage.py
+
+This module is part of the Task Logger program. It defines the storage
+interface used by the rest of the program and its two implementations:
+the Google Sheets worksheet and a local, indexed SQLite file.
+
+Rows are addressed the way the worksheet addresses them: row 1 is the
+header row and task records start at row 2. Cell values are returned as
+strings, exactly as ``Worksheet.get_all_values`` returns them.
+
+Features:
+- Append one or many rows, read everything, read a range of rows.
+- Query the rows of a single month.
+- Delete rows (used to move archived months out of the live task log).
+- A revision tag that changes whenever rows are edited or deleted, so a
+  copy of the task log (the record cache, its snapshot) can tell whether
+  it is still valid.
+- Merge several task logs (e.g. one worksheet per team) into one, reading
+  them all in parallel.
+- Copy the whole task log from one storage to another (e.g. to build a
+  local SQLite replica of the Google Sheet).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+import threading
+import gspread
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from records import pack_date
+
+
+def appended_row_index(response):
+    """
+    Extract the sheet row index written by an ``append_row(s)`` call.
+
+    Args:
+        response: The JSON response returned by the Sheets API append call.
+
+    @return
+        int: The index of the first appended row, or None if the response
+        does not carry an updated range.
+    """
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    # e.g. "Foglio1!A57:F57" -> 57
+    start = updated_range.split("!")[-1].split(":")[0]
+    digits = "".join(char for char in start if char.isdigit())
+    return int(digits) if digits else None
+
+
+def row_runs(rows):
+    """
+    Group row indexes into runs of consecutive rows.
+
+    Args:
+        rows: The row indexes, in any order.
+
+    @return
+        list: (first, last) tuples in ascending order.
+    """
+    runs = []
+    for row in sorted(set(rows)):
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return [tuple(run) for run in runs]
+
+
+def month_key(date):
+    """
+    Turn a DD-MM-YYYY date string into an integer YYYYMM key.
+
+    The key is derived from records.pack_date, so a date the record cache
+    quarantines (e.g. 31-02-2024) has no month here either, and archive
+    summaries, export statistics and SQLite month queries count the same
+    tasks as the live month aggregates.
+
+    Args:
+        date: The date string.
+
+    @return
+        int: The month key, or None if the date is malformed.
+    """
+    packed = pack_date(str(date))
+    return packed // 100 if packed else None
+
+
+class Storage:
+    """
+    Interface implemented by every task log storage backend.
+
+    ``APPENDS_CHANGE_REVISION`` tells whether appending rows changes the
+    revision as well (see revision). ``TAIL_CHECK`` tells whether a range
+    read keeps returning a row at the same index until rows above it are
+    deleted, so the record cache can check a row it holds is still in
+    place instead of reading the revision (see RecordCache.sync).
+    """
+
+    APPENDS_CHANGE_REVISION = True
+    TAIL_CHECK = True
+
+    def revision(self):
+        """
+        Tag the current content of the storage.
+
+        The tag changes whenever a row is edited or deleted, and also when
+        rows are appended if APPENDS_CHANGE_REVISION is set.
+
+        @return
+            str: The revision tag, or None if it cannot be read.
+        """
+        return None
+
+    def header(self):
+        """
+        @return
+            list: The header row, or an empty list if there is none.
+        """
+        raise NotImplementedError
+
+    def set_header(self, headers):
+        """
+        Write the header row to an empty storage.
+
+        Args:
+            headers: The list of column names.
+
+        @return
+            int: The row index of the header row.
+        """
+        raise NotImplementedError
+
+    def append(self, row):
+        """
+        Append a single row.
+
+        Args:
+            row: The list of cell values to append.
+
+        @return
+            int: The row index the row was written to.
+        """
+        return self.append_many([row])
+
+    def append_many(self, rows):
+        """
+        Append several rows in one operation.
+
+        Args:
+            rows: A list of rows, each one a list of cell values.
+
+        @return
+            int: The row index of the first appended row.
+        """
+        raise NotImplementedError
+
+    def read_all(self):
+        """
+        @return
+            list: Every row, header included, as lists of strings.
+        """
+        raise NotImplementedError
+
+    def read_range(self, start, end=None):
+        """
+        Read the rows from ``start`` to ``end`` (inclusive).
+
+        Args:
+            start: The index of the first row to read.
+            end: The index of the last row to read, or None to read up to
+                the last row.
+
+        @return
+            list: The rows in the range, as lists of strings.
+        """
+        raise NotImplementedError
+
+    def delete_rows(self, rows):
+        """
+        Delete task rows; the rows below them move up.
+
+        Args:
+            rows: The row indexes to delete.
+
+        @return
+            None
+        """
+        raise NotImplementedError
+
+    def query_month(self, year, month):
+        """
+        Read the task rows dated in the given month.
+
+        Args:
+            year: The four digit year.
+            month: The month number (1-12).
+
+        @return
+            list: The matching rows, as lists of strings.
+        """
+        key = year * 100 + month
+        return [
+            row for row in self.read_all()[1:]
+            if len(row) > 2 and month_key(row[2]) == key
+        ]
+
+
+class SheetStorage(Storage):
+    """
+    Storage backed by a gspread ``Worksheet``.
+    """
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+
+    def header(self):
+        return self.sheet.row_values(1)
+
+    def set_header(self, headers):
+        return appended_row_index(self.sheet.append_row(headers)) or 1
+
+    def append_many(self, rows):
+        return appended_row_index(self.sheet.append_rows(rows))
+
+    def read_all(self):
+        return self.sheet.get_all_values()
+
+    def read_range(self, start, end=None):
+        return self.sheet.get(f"A{start}:F{end or ''}")
+
+    def revision(self):
+        # The version number of the spreadsheet file, which Drive increases
+        # on every change to its content, appends included; the record
+        # cache checks the tail row instead (needs the Drive metadata scope)
+        spreadsheet = self.sheet.spreadsheet
+        try:
+            response = spreadsheet.client.request(
+                "get", f"{DRIVE_FILES_API_V3_URL}/{spreadsheet.id}",
+                params={"fields": "version", "supportsAllDrives": "true"})
+            return str(response.json()["version"])
+        except (gspread.exceptions.APIError, KeyError, ValueError):
+            return None
+
+    def delete_rows(self, rows):
+        # One call per run of consecutive rows, bottom run first so the
+        # indexes of the runs above stay valid
+        for start, end in reversed(row_runs(rows)):
+            self.sheet.delete_rows(start, end)
+
+
+class SQLiteStorage(Storage):
+    """
+    Storage backed by a local SQLite file.
+
+    Rows keep their worksheet row index as primary key and carry an indexed
+    YYYYMM month key, so reading a range or a month never scans the whole
+    table.
+
+    Triggers count every update and delete of a row or header cell in the
+    ``revision`` table, whoever makes them (this program or any SQLite
+    client), while appends leave the count alone. The revision is that
+    count tagged with an id drawn when the file is created.
+
+    ``SCHEMA_VERSION`` is kept in the file's user_version; files written
+    before the month key followed records.pack_date get their keys
+    recomputed once when opened.
+    """
+
+    APPENDS_CHANGE_REVISION = False
+
+    SCHEMA_VERSION = 1
+
+    COLUMNS = ("name", "task", "date", "hours", "type", "recorded_at")
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS header (
+                position INTEGER PRIMARY KEY,
+                name TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tasks (
+                row INTEGER PRIMARY KEY,
+                name TEXT, task TEXT, date TEXT, hours TEXT,
+                type TEXT, recorded_at TEXT,
+                month_key INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS tasks_month_key ON tasks (month_key);
+            CREATE TABLE IF NOT EXISTS revision (
+                id TEXT NOT NULL,
+                edits INTEGER NOT NULL
+            );
+            INSERT INTO revision (id, edits)
+                SELECT lower(hex(randomblob(8))), 0
+                WHERE NOT EXISTS (SELECT 1 FROM revision);
+            CREATE TRIGGER IF NOT EXISTS tasks_updated AFTER UPDATE ON tasks
+                BEGIN UPDATE revision SET edits = edits + 1; END;
+            CREATE TRIGGER IF NOT EXISTS tasks_deleted AFTER DELETE ON tasks
+                BEGIN UPDATE revision SET edits = edits + 1; END;
+            CREATE TRIGGER IF NOT EXISTS header_updated AFTER UPDATE ON header
+                BEGIN UPDATE revision SET edits = edits + 1; END;
+            CREATE TRIGGER IF NOT EXISTS header_deleted AFTER DELETE ON header
+                BEGIN UPDATE revision SET edits = edits + 1; END;
+            """
+        )
+        self._migrate()
+
+    def _migrate(self):
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        if version >= self.SCHEMA_VERSION:
+            return
+        with self.conn:
+            cursor = self.conn.execute(
+                "SELECT row, date, month_key FROM tasks")
+            changed = [(month_key(date), row) for row, date, key in cursor
+                       if month_key(date) != key]
+            self.conn.executemany(
+                "UPDATE tasks SET month_key = ? WHERE row = ?", changed)
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self.lock:
+            self.conn.close()
+
+    def header(self):
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT name FROM header ORDER BY position")
+            return [name for (name,) in cursor]
+
+    def set_header(self, headers):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM header")
+            self.conn.executemany(
+                "INSERT INTO header (position, name) VALUES (?, ?)",
+                list(enumerate(headers)),
+            )
+        return 1
+
+    def append_many(self, rows):
+        with self.lock, self.conn:
+            (last,) = self.conn.execute(
+                "SELECT COALESCE(MAX(row), 1) FROM tasks").fetchone()
+            values = []
+            for offset, row in enumerate(rows, start=1):
+                cells = [str(value) for value in row][:6]
+                cells += [""] * (6 - len(cells))
+                values.append([last + offset] + cells + [month_key(cells[2])])
+            self.conn.executemany(
+                "INSERT INTO tasks (row, name, task, date, hours, type, "
+                "recorded_at, month_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                values,
+            )
+        return last + 1
+
+    def _select(self, where="", params=()):
+        with self.lock:
+            cursor = self.conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM tasks {where} "
+                "ORDER BY row",
+                params,
+            )
+            return [list(row) for row in cursor]
+
+    def read_all(self):
+        headers = self.header()
+        rows = self._select()
+        return ([headers] if headers else []) + rows
+
+    def read_range(self, start, end=None):
+        where, params = "WHERE row >= ?", [start]
+        if end is not None:
+            where += " AND row <= ?"
+            params.append(end)
+        rows = self._select(where, params)
+        if start <= 1:
+            headers = self.header()
+            if headers:
+                rows.insert(0, headers)
+        return rows
+
+    def query_month(self, year, month):
+        return self._select("WHERE month_key = ?", (year * 100 + month,))
+
+    def revision(self):
+        with self.lock:
+            (revision,) = self.conn.execute(
+                "SELECT id || ':' || edits FROM revision").fetchone()
+            return revision
+
+    def delete_rows(self, rows):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM tasks WHERE row = ?",
+                                  [(row,) for row in rows])
+            # Number the remaining rows from 2 again, going through negative
+            # numbers so no two rows ever share a key
+            remaining = [row for (row,) in self.conn.execute(
+                "SELECT row FROM tasks ORDER BY row")]
+            self.conn.executemany(
+                "UPDATE tasks SET row = ? WHERE row = ?",
+                [(-new, old) for new, old in enumerate(remaining, start=2)])
+            self.conn.execute("UPDATE tasks SET row = -row")
+
+
+class MultiStorage(Storage):
+    """
+    Union of several storages, e.g. one worksheet per team.
+
+    Reads fan out to every storage at once on a thread pool, so reading N
+    task logs costs about one round trip of latency instead of N in
+    sequence. The header is the one of the first storage, followed by the
+    task rows of every storage, in the order the storages are given.
+    Appends go to the first storage.
+
+    Merged rows are numbered in the order they were read. The storage
+    remembers how many rows it has read from each source, so a read of the
+    range right after the last merged row (the tail sync of the record
+    cache) fetches only the tail of every source; any other range is
+    served from a fresh full read.
+
+    Args:
+        storages: The storages to merge, the first one taking the writes.
+    """
+
+    # Rows of the merged log are numbered in the order they were read
+    TAIL_CHECK = False
+
+    def __init__(self, storages):
+        self.storages = list(storages)
+        self.APPENDS_CHANGE_REVISION = any(
+            storage.APPENDS_CHANGE_REVISION for storage in self.storages)
+        self.lock = threading.Lock()
+        # Rows read from each storage (header included) and merged rows
+        # handed out so far (header included)
+        self.counts = [0] * len(self.storages)
+        self.merged = 0
+
+    def _fan_out(self, call, *arguments):
+        """
+        Call ``call(storage, *arguments)`` for every storage in parallel.
+
+        Args:
+            call: The function to call.
+            *arguments: Optional lists holding one argument per storage.
+
+        @return
+            list: The results, in storage order.
+        """
+        if len(self.storages) == 1:
+            return [call(self.storages[0], *(a[0] for a in arguments))]
+        with ThreadPoolExecutor(max_workers=len(self.storages)) as pool:
+            return list(pool.map(call, self.storages, *arguments))
+
+    def header(self):
+        return self.storages[0].header()
+
+    def set_header(self, headers):
+        return self.storages[0].set_header(headers)
+
+    def append_many(self, rows):
+        # Rows are numbered by the first storage, not in the merged order:
+        # returning None leaves them to the next tail sync
+        self.storages[0].append_many(rows)
+        return None
+
+    def read_all(self):
+        with self.lock:
+            results = self._fan_out(lambda storage: storage.read_all())
+            header = results[0][:1]
+            values = header + [row for rows in results for row in rows[1:]]
+            self.counts = [len(rows) for rows in results]
+            self.merged = len(values)
+            return values
+
+    def read_range(self, start, end=None):
+        with self.lock:
+            is_tail = start == self.merged + 1 and end is None
+        if not is_tail:
+            return self.read_all()[start - 1:end]
+
+        with self.lock:
+            counts = list(self.counts)
+            results = self._fan_out(
+                lambda storage, count: storage.read_range(count + 1), counts)
+            values = []
+            for index, rows in enumerate(results):
+                self.counts[index] += len(rows)
+                if not counts[index] and rows:
+                    # The first row of an unread storage is its header
+                    if index == 0 and not self.merged:
+                        values.append(rows[0])
+                    rows = rows[1:]
+                values.extend(rows)
+            self.merged += len(values)
+            return values
+
+    def query_month(self, year, month):
+        results = self._fan_out(
+            lambda storage: storage.query_month(year, month))
+        return [row for rows in results for row in rows]
+
+    def revision(self):
+        revisions = self._fan_out(lambda storage: storage.revision())
+        if None in revisions:
+            return None
+        return " ".join(revisions)
+
+
+def copy_storage(source, target):
+    """
+    Copy the header and every task row from one storage to another.
+
+    Used by the "replicate" command to build a local SQLite replica of the
+    Google Sheet.
+
+    Args:
+        source: The storage to read from.
+        target: The (empty) storage to write to.
+
+    @return
+        int: The number of task rows copied.
+    """
+    values = source.read_all()
+    if not values:
+        return 0
+    target.set_header(values[0])
+    if len(values) > 1:
+        target.append_many(values[1:])
+    return len(values) - 1
@@ -0,0 +1,213 @@
+"""
+tables.py
+
+This module is part of the Task Logger program. It renders tables in the
+PrettyTable layout without building them in memory, so printing every task
+of a large task log stays fast and flat in memory.
+
+Small tables (menus, statistics of one month, a page of View Logs) are
+still rendered by PrettyTable. Larger ones are written row by row: the
+column widths are known before the first row is written, either measured
+in one pass over the cells or taken from the record cache (see
+cache_widths), and the lines are written in batches to the output.
+
+Features:
+- The same borders, padding and alignment as PrettyTable.
+- Column widths of the task log computed from the cache columns and the
+  interned name and type tables, without formatting any record.
+- Widths measured in terminal cells, so accented and wide characters line
+  up as they do in PrettyTable.
+"""
+from collections.abc import Sequence
+import math
+import sys
+from prettytable import PrettyTable
+from wcwidth import wcswidth
+
+# Tables up to this many rows are rendered by PrettyTable
+SMALL_TABLE_ROWS = 50
+# Lines written to the output at once
+BATCH_LINES = 1000
+
+
+def text_width(text):
+    """
+    @return
+        int: The number of terminal cells ``text`` takes.
+    """
+    if text.isascii():
+        return len(text)
+    return max(wcswidth(text), 0)
+
+
+def column_widths(field_names, rows):
+    """
+    Measure the width of every column in one pass over the cells.
+
+    @return
+        list: The widths, at least as wide as the field names.
+    """
+    widths = [text_width(name) for name in field_names]
+    for row in rows:
+        for index, cell in enumerate(row):
+            width = text_width(str(cell))
+            if width > widths[index]:
+                widths[index] = width
+    return widths
+
+
+def _max_width(texts):
+    texts = list(texts)
+    if "".join(texts).isascii():
+        return max(map(len, texts), default=0)
+    return max(map(text_width, texts), default=0)
+
+
+def _hours_text(hours):
+    return str(int(hours)) if hours.is_integer() else str(hours)
+
+
+def cache_widths(cache):
+    """
+    Compute the column widths of the records of a cache from its columns.
+
+    Names and types come from their interned tables, dates have a fixed
+    width and hours are formatted once per distinct value, so the cost is
+    a few passes over the columns at C speed rather than formatting every
+    record.
+
+    @return
+        list: The widths of the six record columns.
+    """
+    with cache.lock:
+        raw = {2: [], 3: []}
+        for (_, column), text in cache.raw_cells.items():
+            raw[column].append(text)
+        hours = {value for value in set(cache.hours) if not math.isnan(value)}
+        widths = [
+            _max_width(cache.name_table.values),
+            _max_width(cache.tasks),
+            max(_max_width(raw[2]), 10 if any(cache.dates) else 0),
+            max(_max_width(raw[3]), _max_width(map(_hours_text, hours))),
+            _max_width(cache.type_table.values),
+            _max_width(cache.recorded),
+        ]
+    return [max(width, text_width(name))
+            for width, name in zip(widths, cache.record_keys())]
+
+
+def cache_rows(cache, positions):
+    """
+    Generate the records at the given positions as lists of cell strings.
+
+    @return
+        generator: One list per record, in the order of ``positions``.
+    """
+    for position in positions:
+        yield ["" if value is None else str(value)
+               for value in cache.row(position)]
+
+
+def _justify(text, width, align):
+    if len(text) > width or not text.isascii():
+        if text_width(text) > width:
+            text = text[:width]
+            while text_width(text) > width:
+                text = text[:-1]
+        width += len(text) - text_width(text)
+    if align == "l":
+        return text.ljust(width)
+    if align == "r":
+        return text.rjust(width)
+    return text.center(width)
+
+
+def render_table(field_names, rows, output=None, title=None, widths=None,
+                 align=None):
+    """
+    Print a table in the PrettyTable layout.
+
+    Args:
+        field_names: The column names.
+        rows: The rows, as lists of cells; any iterable when ``widths`` is
+            given, a sequence otherwise.
+        output: The file object to write to, defaults to stdout.
+        title: Optional title printed above the column names.
+        widths: The column widths, if known in advance. Cells wider than
+            their column are cut.
+        align: Optional mapping of field names to "l", "c" or "r"; columns
+            are centered by default.
+
+    @return
+        None
+    """
+    output = output or sys.stdout
+    align = align or {}
+    if widths is None and not isinstance(rows, Sequence):
+        rows = list(rows)
+    if isinstance(rows, Sequence) and len(rows) <= SMALL_TABLE_ROWS:
+        table = PrettyTable()
+        if title:
+            table.title = title
+        table.field_names = field_names
+        for name, value in align.items():
+            table.align[name] = value
+        for row in rows:
+            table.add_row(list(row))
+        print(table, file=output)
+        return
+
+    widths = list(widths or column_widths(field_names, rows))
+    if title:
+        # Columns grow in proportion to fit a long title, as in PrettyTable
+        content = text_width(title) + 3 - 3 * len(widths)
+        if sum(widths) < content:
+            scale = content / (sum(widths) or 1)
+            widths = [int(width * scale) for width in widths]
+            widths[-1] += content - sum(widths)
+    inner = sum(widths) + 3 * len(widths) - 1
+    border = "+" + "+".join("-" * (width + 2) for width in widths) + "+\n"
+    columns = [(width, align.get(name, "c"))
+               for name, width in zip(field_names, widths)]
+
+    def line(cells):
+        return "| " + " | ".join(
+            _justify(str(cell), width, column_align)
+            for cell, (width, column_align) in zip(cells, columns)) + " |\n"
+
+    head = []
+    if title:
+        head += ["+" + "-" * inner + "+\n",
+                 "| " + _justify(title, inner - 2, "c") + " |\n"]
+    head += [border, line(field_names), border]
+    output.write("".join(head))
+
+    batch = []
+    for row in rows:
+        batch.append(line(row))
+        if len(batch) >= BATCH_LINES:
+            output.write("".join(batch))
+            batch = []
+    batch.append(border)
+    output.write("".join(batch))
+    output.flush()
+
+
+def render_records(cache, positions, output=None):
+    """
+    Print cached records as a table, streaming them when there are many.
+
+    Args:
+        cache: The RecordCache holding the records.
+        positions: The positions of the records to print, in order.
+        output: The file object to write to, defaults to stdout.
+
+    @return
+        None
+    """
+    rows = cache_rows(cache, positions)
+    if len(positions) <= SMALL_TABLE_ROWS:
+        render_table(cache.record_keys(), list(rows), output)
+    else:
+        render_table(cache.record_keys(), rows, output,
+                     widths=cache_widths(cache))
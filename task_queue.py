@@ -0,0 +1,95 @@
+"""
+task_queue.py
+
+This module is part of the Task Logger program. It retries Sheets API
+requests that fail for quota or transient server reasons.
+
+Features:
+- Retry with exponential backoff on quota (429) and server errors.
+- Read and clear the JSON Lines queue file of earlier versions, whose
+  tasks are moved into the journal (see journal.py) on startup.
+"""
+import json
+import os
+import random
+import time
+import gspread
+
+# Status codes worth retrying: quota exceeded and transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def load_queue(path):
+    """
+    Read the rows waiting in the queue file.
+
+    Args:
+        path: Path of the queue file.
+
+    @return
+        list: The queued rows, oldest first. Empty if the file is missing.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as queue_file:
+        return [json.loads(line) for line in queue_file if line.strip()]
+
+
+def clear_queue(path):
+    """
+    Remove every row from the queue file.
+
+    Args:
+        path: Path of the queue file.
+
+    @return
+        None
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def is_retryable(error):
+    """
+    Tell whether a Sheets API error is worth retrying.
+
+    Args:
+        error: A ``gspread.exceptions.APIError``.
+
+    @return
+        bool: True for quota and transient server errors.
+    """
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in RETRYABLE_STATUS
+
+
+def call_with_backoff(func, *args, retries=5, base_delay=1.0):
+    """
+    Call ``func`` and retry it with exponential backoff on API errors.
+
+    The delay doubles after every failed attempt and gets a random jitter
+    so that several sessions hitting the quota at once do not retry in
+    lockstep.
+
+    Args:
+        func: The callable to invoke.
+        *args: Positional arguments passed to ``func``.
+        retries: How many times to retry before giving up.
+        base_delay: The delay in seconds before the first retry.
+
+    @return
+        The value returned by ``func``.
+
+    Raises:
+        gspread.exceptions.APIError: If the error is not retryable or the
+        last retry fails.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(*args)
+        except gspread.exceptions.APIError as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            delay = base_delay * 2 ** attempt
+            time.sleep(delay + random.uniform(0, delay / 2))
+    return None
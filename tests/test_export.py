@@ -0,0 +1,53 @@
+"""
+test_export.py
+
+Tests of the chunked reads behind the export command (export.py), against
+the in-memory worksheet of the benchmarks.
+
+Usage:
+- python3 -m unittest discover tests
+"""
+import unittest
+from benchmarks.fake_sheet import FakeWorksheet
+from export import storage_chunks
+from records import HEADERS
+from storage import SheetStorage
+
+
+def task(number):
+    return [f"Name {number}", f"Task {number}", "01-10-2026", "1",
+            "Marketing", ""]
+
+
+class StorageChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sheet = FakeWorksheet([HEADERS] + [task(n) for n in range(12)])
+        self.storage = SheetStorage(self.sheet)
+
+    def names(self, chunk_rows):
+        return [row[0] for rows in storage_chunks(self.storage, chunk_rows)
+                for row in rows if row]
+
+    def test_reads_every_row(self):
+        self.assertEqual(self.names(4), [f"Name {n}" for n in range(12)])
+
+    def test_cleared_row_at_the_end_of_a_range(self):
+        # Sheet row 5 is the last row of the first range of 4 task rows
+        self.sheet.batch_clear(["A5:F5"])
+        self.assertEqual(self.names(4),
+                         [f"Name {n}" for n in range(12) if n != 3])
+
+    def test_cleared_range(self):
+        self.sheet.batch_clear(["A6:F9"])
+        self.assertEqual(self.names(4),
+                         [f"Name {n}" for n in range(12)
+                          if not 4 <= n <= 7])
+
+    def test_empty_log(self):
+        self.sheet.rows = [HEADERS]
+        self.assertEqual(list(storage_chunks(self.storage, 4)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+test_journal.py
+
+Crash-safety tests of the local task journal (journal.py), including
+several processes logging tasks from the same directory.
+
+Two Journal objects opened in one process hold separate flock locks, just
+like two processes would, so they stand in for two web terminal sessions.
+
+Usage:
+- python3 -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from journal import Journal, existing_slots
+
+ROW_X = ["Ann", "Newsletter", "01-10-2026", "2", "Marketing", ""]
+ROW_Y = ["Bob", "Roadmap", "02-10-2026", "3", "Product", ""]
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "task_journal.jsonl")
+        self.journals = []
+
+    def tearDown(self):
+        for journal in self.journals:
+            if not journal.file.closed:
+                journal.close()
+        self.directory.cleanup()
+
+    def open(self):
+        journal = Journal(self.path)
+        self.journals.append(journal)
+        return journal
+
+    def test_ack_keeps_tasks_of_another_writer(self):
+        first = self.open()
+        second = self.open()
+        first.write(ROW_X)
+        second_id = second.write(ROW_Y)
+        first.ack([entry_id for entry_id, _ in first.pending_entries()])
+        first.close()
+        second.close()
+
+        reopened = self.open()
+        self.assertEqual(reopened.pending_entries(), [(second_id, ROW_Y)])
+
+    def test_open_journals_do_not_share_entries(self):
+        first = self.open()
+        entry_id = first.write(ROW_X)
+        second = self.open()
+        self.assertNotEqual(first.path, second.path)
+        self.assertEqual(second.pending_entries(), [])
+
+        first.close()
+        third = self.open()
+        self.assertEqual(third.pending_entries(), [(entry_id, ROW_X)])
+
+    def test_orphaned_slot_is_taken_over_once(self):
+        first = self.open()
+        second = self.open()
+        entry_id = second.write(ROW_Y)
+        first.close()
+        second.close()
+
+        third = self.open()
+        self.assertEqual(third.pending_entries(), [(entry_id, ROW_Y)])
+        self.assertEqual(existing_slots(self.path), [third.path])
+        self.assertEqual(self.open().pending_entries(), [])
+
+    def test_torn_last_line_is_dropped(self):
+        journal = self.open()
+        entry_id = journal.write(ROW_X)
+        journal.close()
+        with open(self.path, "ab") as journal_file:
+            journal_file.write(b'{"id": "torn", "row": ["Bo')
+
+        reopened = self.open()
+        self.assertEqual(reopened.pending_entries(), [(entry_id, ROW_X)])
+
+    def test_compaction_keeps_pending_entries(self):
+        journal = self.open()
+        first_id, second_id = journal.write_many([ROW_X, ROW_Y])
+        journal.ack([first_id])
+        journal._compact()
+        with open(self.path, encoding="utf-8") as journal_file:
+            self.assertEqual(len(journal_file.readlines()), 1)
+
+        journal.ack([second_id])
+        self.assertEqual(os.path.getsize(self.path), 0)
+        third_id = journal.write(ROW_X)
+        journal.close()
+        self.assertEqual(self.open().pending_entries(), [(third_id, ROW_X)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+test_records.py
+
+Tests of the record cache sync against a Google Sheet (records.py), where
+appends change the revision: rows appended by anyone are fetched with one
+tail read, while deleted or edited rows make the cache load the task log
+again. Runs against the in-memory worksheet of the benchmarks.
+
+Usage:
+- python3 -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from benchmarks.fake_sheet import FakeWorksheet
+from records import HEADERS, RecordCache
+from snapshot import read_snapshot, write_snapshot
+from storage import SheetStorage
+
+
+def task(number):
+    return [f"Name {number}", f"Task {number}", "01-10-2026", "1",
+            "Marketing", f"01-10-2026 10:{number:02d}:00"]
+
+
+class TailSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sheet = FakeWorksheet([HEADERS] + [task(n) for n in range(5)])
+        self.cache = RecordCache(SheetStorage(self.sheet))
+        self.cache.load()
+
+    def names(self):
+        return [self.cache.record(position)["Name"]
+                for position in range(len(self.cache))]
+
+    def test_appends_are_read_without_reloading(self):
+        generation = self.cache.generation
+        self.sheet.append_rows([task(5), task(6)])
+        self.sheet.calls = 0
+        self.assertEqual(self.cache.sync(), 2)
+        self.assertEqual(self.sheet.calls, 1)
+        self.assertEqual(self.cache.generation, generation + 1)
+
+    def test_own_append_is_checked_on_next_read(self):
+        self.cache.append_many([task(5)])
+        self.assertFalse(self.cache.checkable())
+        self.assertEqual(self.cache.sync(), 0)
+        self.assertTrue(self.cache.checkable())
+
+    def test_deleted_row_reloads(self):
+        self.sheet.delete_rows(2)
+        self.sheet.append_rows([task(5)])
+        self.cache.sync()
+        self.assertEqual(self.names(), [f"Name {n}" for n in range(1, 6)])
+
+    def test_edited_last_row_reloads(self):
+        self.sheet.update("A6", [["Edited"] + task(4)[1:]])
+        self.cache.sync()
+        self.assertEqual(self.names()[-1], "Edited")
+
+    def test_snapshot_fetches_only_the_appended_rows(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "tasks.snapshot")
+        self.assertTrue(write_snapshot(self.cache, path, "sheet"))
+        self.sheet.append_rows([task(5)])
+
+        restored = RecordCache(SheetStorage(self.sheet))
+        self.assertTrue(read_snapshot(restored, path, "sheet"))
+        self.sheet.calls = 0
+        self.assertEqual(restored.sync(), 1)
+        self.assertEqual(self.sheet.calls, 1)
+        self.assertEqual(len(restored), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()